@@ -1,75 +1,546 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import hashlib
+import json
 import os
 import math
+import sys
+import threading
+import time
+import warnings
+from multiprocessing.pool import ThreadPool
+from XFormats import ArchiveIndex, StatsJournal
+
+# runs, sorted by the run prefix
+# |-run_prefixes
+# |  |-prefix_1
+# |  |-prefix_N
+# |-run_values
+# |  |-(v_1, ..., v_P)
+# |  |-(v_1, ..., v_P)
+# |-columns: N x metrics array of metric values, NaN: no value
+
+class ArchiveReader(object):
+    """Reads files of runs packed by ArchiveOrderer of XAutomate, opening every archive once."""
+
+    def __init__(self):
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    def read(self, archive_path, prefix, filename):
+        with self._lock:
+            return self._read(archive_path, prefix, filename)
+
+    def _read(self, archive_path, prefix, filename):
+        if archive_path not in self._archives:
+            self._archives[archive_path] = (open(archive_path, 'rb'), ArchiveIndex.read(archive_path))
+        archive, index = self._archives[archive_path]
+        if (prefix, filename) not in index:
+            return None
+        offset, size = index[(prefix, filename)]
+        archive.seek(offset)
+        return archive.read(size)
+
+    def close(self):
+        for archive, _ in self._archives.values():
+            archive.close()
+        self._archives = {}
 
-# stats
-# |-run
-# |-param_values
-# |  |-v_1
-# |  |-v_N
-# |-stats_values
-#    |-s_1_pair
-#    |  |-name_index
-#    |  |-value
-#    |-s_N_pair
-#       |-name_index
-#       |-value
 
 class XAnalyzer(object):
     PRECISION = 4
+    # resources of runs recorded by XAutomate, available as metrics. The peak memory max_rss
+    # of a run is at least the memory of XAutomate at its start, the run is forked from it
+    RESOURCE_METRICS = ('wall_time', 'user_time', 'system_time', 'max_rss', 'written_bytes')
 
-    def __init__(self, stats_filename, results_filename):
-        self._metric_names = []
-        self._stats = []
-        with open(stats_filename, 'r') as stats_file:
-            self._param_names = eval(stats_file.readline())
-            for line in stats_file:
-                prefix, status, path, param_values = eval(line)
-                if status == 'OK':
-                    stats_path = os.path.dirname(stats_filename)
-                    results_path = os.path.normpath(os.path.join(stats_path, path, 
-                                                                 prefix + '_' + results_filename))
-                    if not os.path.exists(results_path):
-                        print 'ERROR! Cannot find a log file', results_path, 'for the run', prefix
-        		plt.show()
-                        continue
-                    with open(results_path, 'r') as results_file:
-                        run_stats = []
-                        for line in results_file:
-                            pair = line.split()
-                            if pair[0] not in self._metric_names:
-                                self._metric_names.append(pair[0])
-                            run_stats.append((self._metric_names.index(pair[0]), pair[1]))
-                        self._stats.append((prefix, param_values, tuple(run_stats)))
-        self._stats = sorted(self._stats, key=lambda stat: int(stat[0]))
+    # version of the format of the cache of parsed results
+    CACHE_VERSION = 1
+    # size of parts of the array processed at once
+    CHUNK_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, stats_filename, results_filename, threads=16, cache=True, rebuild=False,
+                 array_path=None, dtype=np.float64):
+        """Load results of runs recorded in the stats journal.
+
+    Parsed results are cached in '<stats_filename>.<results_filename>.npz' next to the journal.
+    The cache is used while the part of the journal it was built from is unchanged, only
+    records appended since then are parsed.
+
+    Args:
+        stats_filename: Path of 'stats.txt' of the execution
+        results_filename: Name of the results file of the application
+        threads: Number of results files read at the same time
+        cache: Use and update the cache of parsed results
+        rebuild: Parse all results again instead of using the cache
+        array_path: Path of the '.npy' file, in which the array of results is memory-mapped
+                    instead of being in memory. The values of every metric are stored together
+                    and it can be opened again by XAnalyzer.load(). None: the array is in memory
+        dtype: Type of values of the array, e.g. np.float32 for a half of the size
+    """
+        self._stats_filename = stats_filename
+        self._results_filename = results_filename
+        self._threads = threads
+        self._array_path = array_path
+        self._dtype = dtype
+        self._callbacks = []
+        # the array is stored with the metrics in the first axis
+        self._metric_first = True
+        self._reset()
+        cache_path = stats_filename + '.' + os.path.basename(results_filename) + '.npz'
+        self._cache_path = cache_path if cache else None
+        cached = cache and not rebuild and self._loadCache(cache_path)
+        if cached:
+            print 'Results of %i runs are taken from the cache.' % len(self._run_prefixes)
+        pending = len(self._pending)
+        runs = self._readJournal()
+        self._ingest(runs)
+        if cache and (not cached or len(runs) > 0 or len(self._pending) != pending):
+            self._saveCache(cache_path)
+        if len(self._pending) > 0 or self._corrupt > 0:
+            print 'WARNING: Results of %i runs are missing and of %i runs are corrupt.' % \
+                (len(self._pending), self._corrupt)
         self._param_values = []
         print 'There are:'
         for p in range(len(self._param_names)):
-            self._param_values.append(list(set((s[1][p] for s in self._stats))))
-            self._param_values[p] = sorted(self._param_values[p], key=float)
+            self._param_values.append(sorted(self._code_values[p], key=float))
             print '', len(self._param_values[p]), 'values of %s:' % self._param_names[p], '\t'
             print ', '.join(map(lambda x: str(round(float(x), XAnalyzer.PRECISION)), self._param_values[p]))
         print ' Available metrics:\n', ', '.join(map(str, self._metric_names))
         print 
         self._np_array = self._createMultiArray()
 
+    def _reset(self):
+        self._version = None
+        self._param_names = ()
+        # bytes of the journal parsed so far, their last line identifies them
+        self._offset = 0
+        self._tail_hash = None
+        self._tail_length = 0
+        self._metric_names = []
+        self._metric_indices = {}
+        # parameter values of runs are coded in the order of their first appearance
+        self._code_values = []
+        self._value_codes = []
+        self._run_prefixes = []
+        self._run_values = []
+        self._run_codes = np.zeros((0, 0), dtype=int)
+        self._columns = np.zeros((0, 0))
+        # runs whose results files are missing, they are read again by the next refresh
+        self._pending = []
+        self._corrupt = 0
+
+    def _readJournal(self):
+        """Returns the runs recorded OK since the parsed part of the journal."""
+        with open(self._stats_filename, 'rb') as stats_file:
+            stats_file.seek(self._offset)
+            data = stats_file.read()
+        # without a trailing line, which is being written
+        data = data[:data.rfind('\n') + 1]
+        if not data:
+            return []
+        self._offset += len(data)
+        tail = data[data.rfind('\n', 0, len(data) - 1) + 1:]
+        self._tail_hash, self._tail_length = hashlib.sha1(tail).hexdigest(), len(tail)
+        lines = data.splitlines()
+        if self._version is None:
+            self._version, self._param_names = StatsJournal.parseHeader(lines.pop(0))
+            self._code_values = [[] for _ in self._param_names]
+            self._value_codes = [{} for _ in self._param_names]
+            self._run_codes = np.zeros((0, len(self._param_names)), dtype=int)
+        runs = [(int(prefix), prefix, path, param_values, info) for prefix, _, path, param_values, info
+                in StatsJournal.parseRecords(lines, self._version, 'OK')]
+        runs.sort(key=lambda run: run[0])
+        return runs
+
+    def _ingest(self, runs):
+        """Read results of the runs and add them to the parsed results.
+
+    Runs whose results were missing before are read again, their files may have become
+    visible on a shared file system since then.
+
+    Returns codes of values and metric values of the added runs.
+    """
+        progress = len(runs) > 0
+        runs, self._pending = self._pending + runs, []
+        stats_path = os.path.dirname(self._stats_filename)
+        archives = ArchiveReader()
+        pool = ThreadPool(self._threads)
+        contents = pool.imap(lambda run: XAnalyzer._readResults(archives, stats_path, run[2], run[1],
+                                                                self._results_filename), runs, 16)
+        run_codes = np.zeros((len(runs), len(self._param_names)), dtype=int)
+        columns = np.empty((len(runs), max(8, len(self._metric_names))))
+        columns.fill(np.nan)
+        row = 0
+        for i, content in enumerate(contents):
+            if progress and i % 1000 == 0:
+                XAnalyzer._printProgress(i, len(runs))
+            _, prefix, _, param_values, info = runs[i]
+            if content is None:
+                self._pending.append(runs[i])
+                continue
+            pairs = XAnalyzer._parseResults(content)
+            if pairs is None:
+                self._corrupt += 1
+                continue
+            pairs.extend((name, float(info[name])) for name in XAnalyzer.RESOURCE_METRICS
+                         if name in info)
+            self._run_prefixes.append(prefix)
+            self._run_values.append(param_values)
+            for p, value in enumerate(param_values):
+                if value not in self._value_codes[p]:
+                    self._value_codes[p][value] = len(self._code_values[p])
+                    self._code_values[p].append(value)
+                run_codes[row, p] = self._value_codes[p][value]
+            for name, value in pairs:
+                if name not in self._metric_indices:
+                    self._metric_indices[name] = len(self._metric_names)
+                    self._metric_names.append(name)
+                    if len(self._metric_names) > columns.shape[1]:
+                        width = columns.shape[1]
+                        columns = np.hstack((columns, np.empty(columns.shape)))
+                        columns[:, width:].fill(np.nan)
+                columns[row, self._metric_indices[name]] = value
+            row += 1
+        if progress:
+            XAnalyzer._printProgress(len(runs), len(runs))
+            print
+        pool.close()
+        archives.close()
+        run_codes, columns = run_codes[:row], columns[:row, :len(self._metric_names)]
+        old_columns = np.empty((self._columns.shape[0], len(self._metric_names)))
+        old_columns.fill(np.nan)
+        old_columns[:, :self._columns.shape[1]] = self._columns
+        self._columns = np.vstack((old_columns, columns))
+        self._run_codes = np.vstack((self._run_codes, run_codes))
+        # runs added later may have lower prefixes, e.g. after resuming
+        order = np.argsort([int(prefix) for prefix in self._run_prefixes], kind='mergesort')
+        if (order != np.arange(len(order))).any():
+            self._run_prefixes = [self._run_prefixes[i] for i in order]
+            self._run_values = [self._run_values[i] for i in order]
+            self._run_codes = self._run_codes[order]
+            self._columns = self._columns[order]
+        return run_codes, columns
+
+    def _loadCache(self, cache_path):
+        """Take parsed results from the cache if it is valid for the journal. Returns success."""
+        try:
+            with np.load(cache_path) as cache:
+                meta = json.loads(cache['meta'].item())
+                columns, run_codes = cache['columns'], cache['run_codes']
+        except (IOError, ValueError, KeyError):
+            return False
+        if meta.get('cache_version') != XAnalyzer.CACHE_VERSION or \
+                meta['results_filename'] != self._results_filename:
+            return False
+        stat = os.stat(self._stats_filename)
+        if stat.st_size < meta['offset']:
+            return False
+        if stat.st_size != meta['size'] or stat.st_mtime != meta['mtime']:
+            # the journal is changed, the cached part has to be the same
+            with open(self._stats_filename, 'rb') as stats_file:
+                stats_file.seek(meta['offset'] - meta['tail_length'])
+                if hashlib.sha1(stats_file.read(meta['tail_length'])).hexdigest() != meta['tail_hash']:
+                    return False
+        self._version, self._param_names = meta['version'], tuple(meta['param_names'])
+        self._offset, self._tail_hash, self._tail_length = meta['offset'], meta['tail_hash'], \
+            meta['tail_length']
+        self._metric_names = meta['metric_names']
+        self._metric_indices = dict((name, i) for i, name in enumerate(self._metric_names))
+        self._code_values = meta['code_values']
+        self._value_codes = [dict((value, code) for code, value in enumerate(values))
+                             for values in self._code_values]
+        self._run_prefixes = meta['run_prefixes']
+        self._run_values = [tuple(values) for values in meta['run_values']]
+        self._run_codes = run_codes.reshape((len(self._run_prefixes), len(self._param_names)))
+        self._columns = columns.reshape((len(self._run_prefixes), len(self._metric_names)))
+        self._pending = [(run[0], run[1], run[2], tuple(run[3]), run[4]) for run in meta['pending']]
+        self._corrupt = meta['corrupt']
+        return True
+
+    def _saveCache(self, cache_path):
+        stat = os.stat(self._stats_filename)
+        meta = {'cache_version': XAnalyzer.CACHE_VERSION, 'results_filename': self._results_filename,
+                'size': stat.st_size, 'mtime': stat.st_mtime, 'offset': self._offset,
+                'tail_hash': self._tail_hash, 'tail_length': self._tail_length,
+                'version': self._version, 'param_names': self._param_names,
+                'metric_names': self._metric_names, 'code_values': self._code_values,
+                'run_prefixes': self._run_prefixes, 'run_values': self._run_values,
+                'pending': self._pending, 'corrupt': self._corrupt}
+        temp_path = cache_path + '.part'
+        try:
+            with open(temp_path, 'wb') as cache_file:
+                np.savez(cache_file, meta=np.array(json.dumps(meta)), columns=self._columns,
+                         run_codes=self._run_codes)
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError) as e:
+            print 'WARNING: Cannot save the cache of results \'%s\': %s' % (cache_path, e)
+
+    @staticmethod
+    def _printProgress(done, count):
+        print '\rRead results: {:d}/{:d}'.format(done, count),
+        sys.stdout.flush()
+
+    @staticmethod
+    def _readResults(archives, stats_path, path, prefix, results_filename):
+        """Returns the content of the results file of the run or None if it is missing."""
+        archive_path = os.path.normpath(os.path.join(stats_path, path))
+        if os.path.isfile(archive_path):
+            # the run is packed by ArchiveOrderer
+            return archives.read(archive_path, prefix, results_filename)
+        try:
+            with open(os.path.join(archive_path, prefix + '_' + results_filename), 'r') as results_file:
+                return results_file.read()
+        except IOError:
+            return None
+
+    @staticmethod
+    def _parseResults(content):
+        """Returns the list of (metric name, value) of the results file or None if it is corrupt."""
+        pairs = []
+        for line in content.splitlines():
+            pair = line.split()
+            if len(pair) == 0:
+                continue
+            try:
+                pairs.append((pair[0], float(pair[1])))
+            except (IndexError, ValueError):
+                return None
+        return pairs
+
     def _createMultiArray(self):
-        shape = []
-        for values in self._param_values:
-            shape.append(len(values))
-        shape.append(len(self._metric_names))
-        array = np.zeros(tuple(shape))
-
-        for stat in self._stats:
-            p_indices = []
-            for i, param in enumerate(stat[1]):
-                p_indices.append(self._param_values[i].index(param))
-            for i in range(len(self._metric_names)):
-                s_ind, value = stat[2][i]
-                indices = tuple(p_indices) + (s_ind,)
-                array[indices] = value
+        """Returns the array of metrics over the parameter grid, NaN where there is no result."""
+        path = None if self._array_path is None else os.path.splitext(self._array_path)[0] + '.npy'
+        array = self._allocate(path)
+        if len(self._run_values) > 0:
+            array[self._axisIndices(self._run_codes)] = self._columns
+        if self._array_path is not None:
+            array.flush()
+            self._saveMetadata(self._array_path, metric_first=True)
         return array
+
+    def _allocate(self, path):
+        """Returns the NaN array of the parameter grid and the metrics, memory-mapped in path if it is given.
+
+    The values of a metric are stored together, so reading one metric of a memory-mapped array
+    touches only its pages. The returned array is a view with the metrics in the last axis.
+    """
+        shape = (len(self._metric_names),) + tuple(len(values) for values in self._param_values)
+        if path is None:
+            array = np.empty(shape, dtype=self._dtype)
+        else:
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=self._dtype, shape=shape)
+        # a memory-mapped array is not in memory at once
+        for chunk in self._chunks(array):
+            array[chunk] = np.nan
+        return np.moveaxis(array, 0, -1)
+
+    def _axisIndices(self, run_codes):
+        """Returns indices of runs in the array, looked up from codes of their values once per axis."""
+        p_indices = []
+        for p, values in enumerate(self._param_values):
+            axis_index = np.empty(len(values), dtype=int)
+            for j, value in enumerate(values):
+                axis_index[self._value_codes[p][value]] = j
+            p_indices.append(axis_index[run_codes[:, p]])
+        return tuple(p_indices)
+
+    def _growArray(self, old_param_values, old_metrics):
+        """Returns the array enlarged for new parameter values and metrics, keeping its results."""
+        old_array = self._np_array
+        part_path = None
+        if self._array_path is not None:
+            # the enlarged array replaces the file once it is complete
+            part_path = os.path.splitext(self._array_path)[0] + '.part.npy'
+        array = self._allocate(part_path)
+        # positions of the old values among the values now, values are only added
+        positions = []
+        for p, values in enumerate(old_param_values):
+            position = dict((value, j) for j, value in enumerate(self._param_values[p]))
+            positions.append(np.array([position[value] for value in values], dtype=int))
+        positions.append(np.arange(old_metrics))
+        if old_array.size > 0:
+            # the old array is copied along its first axis part by part
+            for chunk in self._chunks(old_array):
+                index = np.ix_(positions[0][chunk], *positions[1:])
+                array[index] = old_array[chunk]
+        if self._array_path is not None:
+            array.flush()
+            del array, old_array
+            self._np_array = None
+            path = os.path.splitext(self._array_path)[0] + '.npy'
+            os.rename(part_path, path)
+            # mapped again, so the array refers to its file by the final name
+            array = np.moveaxis(np.lib.format.open_memmap(path, mode='r+'), 0, -1)
+        return array
+
+    def refresh(self):
+        """Add runs recorded in the journal since the last load or refresh to the analysis.
+
+    The array is updated in place. It is enlarged only when new runs bring new parameter
+    values or metrics. Runs whose results files were missing are read again. The cache of
+    parsed results is updated. Callbacks are called with the number of added runs.
+
+    Returns the number of added runs.
+    """
+        runs = self._readJournal()
+        if len(runs) == 0 and len(self._pending) == 0:
+            return 0
+        old_param_values = [list(values) for values in self._param_values]
+        old_metrics = len(self._metric_names)
+        run_codes, columns = self._ingest(runs)
+        if len(runs) == 0 and len(columns) == 0:
+            # results of missing runs are still missing
+            return 0
+        if self._cache_path is not None:
+            self._saveCache(self._cache_path)
+        self._param_values = [sorted(values, key=float) for values in self._code_values]
+        if self._param_values != old_param_values or len(self._metric_names) != old_metrics:
+            self._np_array = self._growArray(old_param_values, old_metrics)
+        if len(columns) > 0:
+            self._np_array[self._axisIndices(run_codes)] = columns
+        if self._array_path is not None:
+            self._np_array.flush()
+            self._saveMetadata(self._array_path, metric_first=True)
+        for callback in self._callbacks:
+            callback(self, len(columns))
+        return len(columns)
+
+    def addCallback(self, callback):
+        """Register a function called as callback(analyzer, count) after runs are added by refresh."""
+        self._callbacks.append(callback)
+
+    def follow(self, interval=10.0, metric_name=None, maximize=False, idle=None):
+        """Follow a running execution, adding runs as soon as they are recorded in the journal.
+
+    Stops on Ctrl+C or when nothing was recorded for idle seconds.
+
+    Args:
+        interval: Seconds between reads of the journal
+        metric_name: Name of the metric whose best result so far is printed after new runs.
+                     None: no summary
+        maximize: The best result of the metric is the largest one instead of the smallest
+        idle: Seconds without new runs after which following stops. None: follow until Ctrl+C
+    """
+        last_change = time.time()
+        try:
+            while True:
+                count = self.refresh()
+                if count > 0:
+                    last_change = time.time()
+                    if metric_name is not None and metric_name in self._metric_indices:
+                        self._printBest(metric_name, maximize)
+                elif idle is not None and time.time() - last_change >= idle:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print
+        print 'Stopped following after %i runs.' % len(self._run_prefixes)
+
+    def _printBest(self, metric_name, maximize):
+        values = self._columns[:, self._metric_indices[metric_name]]
+        if np.isnan(values).all():
+            return
+        row = np.nanargmax(values) if maximize else np.nanargmin(values)
+        print 'Runs: %i, best %s: %s (run %s: %s)' % (len(self._run_prefixes), metric_name,
+            round(values[row], XAnalyzer.PRECISION), self._run_prefixes[row],
+            ', '.join('%s=%s' % (name, value)
+                      for name, value in zip(self._param_names, self._run_values[row])))
+
+    def _chunks(self, array):
+        """Yields slices of the first axis of the array with about CHUNK_BYTES of data."""
+        length = array.shape[0] if array.ndim > 0 else 0
+        step = max(1, XAnalyzer.CHUNK_BYTES // max(1, array[:1].nbytes))
+        for start in range(0, length, step):
+            yield slice(start, min(start + step, length))
+
+    def _saveMetadata(self, filename, metric_first=False):
+        metadata = {'param_names': self._param_names, 'param_values': self._param_values,
+                    'metric_names': self._metric_names}
+        if metric_first:
+            # the first axis of the saved array is the metric
+            metadata['metric_first'] = True
+        with open(os.path.splitext(filename)[0] + '.json', 'w') as f:
+            json.dump(metadata, f)
+
+    @staticmethod
+    def load(filename):
+        """Open the array saved by saveNPArray or created in array_path, memory-mapped.
+
+    Plots and reductions of the analysis work without reading the whole array. The results
+    of single runs are not available, so saveTable writes no runs.
+    """
+        path = os.path.splitext(filename)[0]
+        with open(path + '.json', 'r') as f:
+            metadata = json.load(f)
+        analyzer = XAnalyzer.__new__(XAnalyzer)
+        analyzer._param_names = tuple(metadata['param_names'])
+        analyzer._param_values = metadata['param_values']
+        analyzer._metric_names = metadata['metric_names']
+        analyzer._run_prefixes, analyzer._run_values = [], []
+        analyzer._columns = np.zeros((0, len(analyzer._metric_names)))
+        analyzer._np_array = np.load(path + '.npy', mmap_mode='r')
+        analyzer._metric_first = metadata.get('metric_first', False)
+        if analyzer._metric_first:
+            analyzer._np_array = np.moveaxis(analyzer._np_array, 0, -1)
+        return analyzer
+
+    def reduce(self, metric_name, reduction='min', param=None):
+        """Reduce the metric over a parameter part by part, ignoring missing results.
+
+    Args:
+        metric_name: Name of the metric
+        reduction: 'min', 'max', 'mean', 'argmin' or 'argmax'. Arg reductions give indices of
+                   values of the parameter, -1 where all results are missing
+        param: Name of the parameter to reduce over. None: all parameters, the result is a
+               number or for arg reductions the tuple of parameter values (None if no results)
+    """
+        if reduction not in ('min', 'max', 'mean', 'argmin', 'argmax'):
+            raise ValueError('Unknown reduction ' + repr(reduction))
+        data = self._np_array[..., self._metric_names.index(metric_name)]
+        axis = None if param is None else self._param_names.index(param)
+        # the maximum is the minimum of negated values
+        sign = -1 if reduction in ('max', 'argmax') else 1
+        parts = []
+        total = None
+        for chunk in self._chunks(data):
+            values = np.asarray(data[chunk], dtype=np.float64)
+            if axis is None:
+                offset = chunk.start * (values[:1].size)
+                values, chunk_axis = values.ravel(), 0
+            else:
+                offset = chunk.start if axis == 0 else 0
+                chunk_axis = axis
+            missing = np.isnan(values)
+            filled = np.where(missing, np.inf, sign * values)
+            part = [filled.min(chunk_axis), filled.argmin(chunk_axis) + offset,
+                    np.where(missing, 0, values).sum(chunk_axis), (~missing).sum(chunk_axis)]
+            if axis is not None and axis != 0:
+                parts.append(part)
+            elif total is None:
+                total = part
+            else:
+                better = part[0] < total[0]
+                total = [np.where(better, part[0], total[0]), np.where(better, part[1], total[1]),
+                         total[2] + part[2], total[3] + part[3]]
+        if parts:
+            total = [np.concatenate([part[i] for part in parts]) for i in range(4)]
+        best, indices, sums, counts = total
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if reduction == 'mean':
+                result = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+            elif reduction in ('min', 'max'):
+                result = np.where(counts > 0, sign * best, np.nan)
+            else:
+                result = np.where(counts > 0, indices, -1)
+        if axis is not None:
+            return result
+        if reduction in ('argmin', 'argmax'):
+            if result < 0:
+                return None
+            position = np.unravel_index(int(result), data.shape)
+            return tuple(self._param_values[p][i] for p, i in enumerate(position))
+        return float(result)
     
     def saveTable(self, filename, title=True, separator='\t'):
         with open(filename, 'w') as f:
@@ -77,21 +548,25 @@ class XAnalyzer(object):
                 header = separator.join(['run'] + [p for p in self._param_names] + 
                                         [s for s in self._metric_names])
                 f.write(header + '\n')
-            for stats in self._stats:
-                line = separator.join([stats[0]] + 
-                                      [str(round(float(p), XAnalyzer.PRECISION)) for p in stats[1]] +
-                                      [pair[1] for pair in stats[2]])
+            for prefix, param_values, values in zip(self._run_prefixes, self._run_values, self._columns):
+                line = separator.join([prefix] + 
+                                      [str(round(float(p), XAnalyzer.PRECISION)) for p in param_values] +
+                                      ['' if np.isnan(v) else '%.12g' % v for v in values])
                 f.write(line + '\n')
 
     def saveNPArray(self, filename):
-        path, ext = os.path.splitext(filename)
-        if not ext or ext == '.npy' or ext == '.npz':
-            ext = '.txt'
-        with open(path + ext, 'w') as f:
-            f.write(repr(self._param_names) + '\n')
-            f.write(repr(self._param_values) + '\n')
-            f.write(repr(self._metric_names) + '\n')
-        np.save(path, self._np_array)
+        """Save the array and its parameters and metrics in '.json', to be opened by XAnalyzer.load()."""
+        path = os.path.splitext(filename)[0]
+        backing_path = getattr(self._np_array, 'filename', None)
+        if backing_path is not None and os.path.exists(path + '.npy') and \
+                os.path.samefile(backing_path, path + '.npy'):
+            # the memory-mapped file is never overwritten by itself
+            self._np_array.flush()
+            self._saveMetadata(path, metric_first=self._metric_first)
+        else:
+            # saved with the metrics in the last axis
+            np.save(path, self._np_array)
+            self._saveMetadata(path)
 
     def _checkParametersAndDimensions(self, dimensions, params, metrics):
         if len(self._np_array.shape) != dimensions + 1:
@@ -114,8 +589,8 @@ class XAnalyzer(object):
     def _2DPlot(self, _plt, data, x_ind, y_ind, metric_name):
         PRECISION = 3        
         fig, ax = _plt.subplots()
-        cax = ax.imshow(data, interpolation='nearest', vmin=data.min(),
-                   vmax=data.max(), origin='lower', cmap = 'RdYlGn_r')
+        cax = ax.imshow(data, interpolation='nearest', vmin=np.nanmin(data),
+                   vmax=np.nanmax(data), origin='lower', cmap = 'RdYlGn_r')
         ax.set_title(metric_name)
         cbar = fig.colorbar(cax)
         _plt.grid(False)
@@ -156,8 +631,8 @@ class XAnalyzer(object):
 
             plt.subplot(rows, cols, i + 1)
             plt.title(metric_name)
-            plt.imshow(data, interpolation='nearest', vmin=data.min(),
-                       vmax=data.max(), origin='lower')
+            plt.imshow(data, interpolation='nearest', vmin=np.nanmin(data),
+                       vmax=np.nanmax(data), origin='lower')
             plt.colorbar()
             plt.grid(True)
             plt.xlabel(param_x)
@@ -217,7 +692,7 @@ class XAnalyzer(object):
 	
 	p1_name = self._param_names[i1]
 	p2_name = self._param_names[i2]
-	min_value = np.argmin(data)
+	min_value = np.nanargmin(data)
 	#print min_value
 	#print data.shape
 	
@@ -227,7 +702,7 @@ class XAnalyzer(object):
 	p2_value = self._param_values[i2][min_value % data.shape[1]]
 
 	#print slice_param, slice_param_value, np.min(data), p1_name, p1_value, p2_name, p2_value
-	print np.min(data), p1_name, p1_value, p2_name, p2_value
+	print np.nanmin(data), p1_name, p1_value, p2_name, p2_value
 
     def plot2DSliceMany(self, param_x, param_y, slice_param, slice_value_index, cols, *metric_names):
         PRECISION = 3
@@ -252,8 +727,8 @@ class XAnalyzer(object):
                 data = data.T
             plt.subplot(rows, cols, i + 1)
             plt.title(metric_name)
-            plt.imshow(data, interpolation='nearest', vmin=data.min(),
-                       vmax=data.max(), origin='lower')
+            plt.imshow(data, interpolation='nearest', vmin=np.nanmin(data),
+                       vmax=np.nanmax(data), origin='lower')
             plt.colorbar()
             plt.grid(True)
             plt.xlabel(param_x)
@@ -27,44 +27,97 @@ automate = XAutomate(application_path='/programs/my_app',
 # Run 'process.py' with parametrized command line parameters. 
 # Output results from 2 parameters to folders named after each parameter and its value: '/results/alpha-10/sigma-5/'                         
 automate = XAutomate(application_path='/scripts/process.py',
+                     settings_path=None,
                      command='alpha=${alpha} sigma=${sigma}',
                      output_path='/results/',
                      orderer=TreeOrderer(depth=2))
 """
 
+import ast
+import ctypes
+import ctypes.util
+import errno
+import gzip
+import hashlib
+import heapq
+import importlib
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
 import os
+import Queue
+import random
 import re
+import shlex
+import shutil
+import signal
+import socket
+import SocketServer
 import string
 import subprocess
 import sys
+import tarfile
 import tempfile
 import threading
-from collections import Counter
-from decimal import Decimal
+import time
+import traceback
+from collections import Counter, OrderedDict, deque
+from decimal import Context, Decimal
 from multiprocessing.pool import ThreadPool
 from string import Template
+from XFormats import ArchiveIndex, StatsJournal
 
 class XAutomate(object):
-    def __init__(self, application_path, settings_path, output_path, orderer):
+    # placeholder of the path of the settings file in the command
+    SETTINGS_FILE = 'settings_file'
+
+    def __init__(self, application_path, settings_path, output_path, orderer, cache=None,
+                 command=None):
         """Setup automation class.
 
     Args:
-        application_path: Full path and name to the application or script
-        settings_path: Full path and name to the settings file
+        application_path: Full path and name to the application or script, or PythonTarget class
+                          to call a Python function in a pool of processes
+        settings_path: Full path and name to the settings file. None: no settings file, only
+                       for a PythonTarget or a command
         output_path: path of the results
         orderer: TreeOrder class to control how the results are structured into folders. TreeOrder(depth=0): same folder; TreeOrder(depth=2): 2-level subfolders 
+        cache: ResultCache class to reuse results of identical runs of previous executions. None: no caching
+        command: Template of the command line arguments of the application, e.g. 'alpha=${alpha} sigma=${sigma}'.
+                 The settings file is written into the run folder only if settings_path is specified,
+                 the command refers to its path by ${settings_file}, e.g. '-c ${settings_file} -v'.
+                 None: the path of the settings file is the only argument
 
     """
         self._application_path = application_path
         self._settings_path = settings_path
+        self._command = command
         self._output_path = output_path
         self._parameters = []
         self._fixed_parameters = {}
         self._orderer = orderer
+        self._cache = cache
+        self._pruner = None
+        self._timeout = None
+        self._retry = None
+        self._output_log = OutputLog()
+        self._warm = None
+        self._process_pool = None
+        self._transfer = None
+        self._resources = None
+        self._python = isinstance(self._application_path, PythonTarget)
         # file and directory existence
-        if not os.path.exists(self._settings_path) or not os.path.isfile(self._settings_path):
+        if self._python and self._command is not None:
+            sys.exit('Terminated. Command cannot be used with a Python function.')
+        if self._settings_path is None:
+            if not self._python and self._command is None:
+                sys.exit('Terminated. Settings file is not specified.')
+        elif not os.path.exists(self._settings_path) or not os.path.isfile(self._settings_path):
             sys.exit('Terminated. Settings file \'' + self._settings_path + '\' is not found.')
-        if not os.path.exists(self._application_path) or not os.path.isfile(self._application_path):
+        if not self._python and (not os.path.exists(self._application_path) or \
+                not os.path.isfile(self._application_path)):
             sys.exit('Terminated. Application file \'' + self._application_path + '\' is not found.')
         if not os.path.exists(self._output_path) or not os.path.isdir(self._output_path):
                 try:
@@ -93,30 +146,29 @@ class XAutomate(object):
     def addFixedParameters(self, **dictionary):
         self._fixed_parameters.update(dictionary)
 
-    def _combinations(self, parameters, combination=[]):
-        for value in parameters[0]:
-            new_combination = combination[:]
-            new_combination.append((parameters[0].name, value))
-            if len(parameters) != 1:
-                for _combination in self._combinations(parameters[1:], new_combination):
-                    yield _combination
-            else:
-                yield new_combination
-
     def _validateTemplateAndParameters(self, settings):
         # empty parameters
         has_no_values = False
         for parameter in self._parameters:
-            if len([value for value in parameter]) == 0:
+            if len(parameter) == 0:
                 print 'WARNING: Parameter \'' + parameter.name + '\' has no values.'      
                 has_no_values = True
         if has_no_values:
             sys.exit('Terminated. Some parameters have no values.')
         # difference between template and specified parameters
         pattern = re.compile(r'\$\{\w+}')
-        template_parameters = [p[2:-1] for p in pattern.findall(settings)]
+        template_parameters = [p[2:-1] for p in pattern.findall(settings or '')]
         specified_parameters = [p.name for p in self._parameters]
         fixed_parameters = self._fixed_parameters.keys()
+        if self._command is not None:
+            command_parameters = [p[2:-1] for p in pattern.findall(self._command)]
+            if self._settings_path is not None:
+                if XAutomate.SETTINGS_FILE in specified_parameters + fixed_parameters:
+                    sys.exit('Terminated. Parameter name \'' + XAutomate.SETTINGS_FILE + '\' is reserved ' + \
+                        'for the path of the settings file in the command.')
+                command_parameters = [p for p in command_parameters if p != XAutomate.SETTINGS_FILE]
+            template_parameters += command_parameters
+            settings = (settings or '') + '\n' + self._command
         
         duplicated = [key for key, value in Counter(specified_parameters).items() if value > 1]
         if len(duplicated) > 0:
@@ -128,6 +180,9 @@ class XAutomate(object):
             sys.exit('Terminated. Parametes ' + str(list(both_types)) + ' cannot be ' + \
                 'specified and fixed at the same time.')         
 
+        if settings is None:
+            return
+
         non_specified = set(template_parameters) - set(specified_parameters + fixed_parameters)
         if len(non_specified) > 0:
             sys.exit('Terminated. Parametes ' + str(list(non_specified)) + ' have to be ' + \
@@ -139,6 +194,8 @@ class XAutomate(object):
                 'template file.')
 
     def _read_settings(self):
+        if self._settings_path is None:
+            return None
         try:
             with open(self._settings_path, 'r') as settings_file:
                 settings = settings_file.read()
@@ -147,70 +204,2024 @@ class XAutomate(object):
             sys.exit('Terminated. Cannot read settings file \'' + self._settings_path +'\'.')
    
     def _run(self, (iteration, parameters)):
-        temp_dir = self._orderer.getLocalTempFolder()
+        if self._transfer is not None:
+            self._transfer.acquire()
+            try:
+                return self._compute(iteration, parameters)
+            except Exception:
+                self._transfer.release()
+                raise
+        return self._place(self._compute(iteration, parameters))
+
+    def _place(self, result):
+        """Move files of the computed run from its temporary folder to the destination."""
+        iteration, parameters, temp_dir, status, cached, info = result
+        destination = self._orderer.orderFiles(iteration, parameters, temp_dir)
+        # a run computed directly in its destination has no temporary folder
+        if destination != temp_dir:
+            try:
+                os.rmdir(temp_dir)
+            except OSError as e:
+                print 'WARNING: Cannot delete temporary folder:\''+e.filename+'\''
+        return iteration, parameters, destination, status, cached, info
+
+    def _compute(self, iteration, parameters):
+        temp_dir = self._orderer.getRunFolder(iteration, parameters)
         setting_filename = self._orderer.getSettingFilename()
         settings_path = os.path.join(temp_dir, setting_filename)
-        with open(settings_path, 'w') as \
-                settings_file:
-            xml_text = self._settings_template.substitute(dict(parameters + \
-                self._fixed_parameters.items()))
-            settings_file.write(xml_text)
-        output = 'Something went wrong.'
-        failure = False
+        values = dict(parameters + self._fixed_parameters.items())
+        if self._settings_template is not None:
+            xml_text = self._settings_template.substitute(values)
+            # identifies the run for the cache
+            run_text = xml_text
+        else:
+            xml_text = None
+            run_text = repr(sorted(values.items()))
+        if self._command_template is not None:
+            command_values, key_values = dict(values), dict(values)
+            if self._settings_template is not None:
+                # the cache key does not depend on the run folder
+                command_values[XAutomate.SETTINGS_FILE] = os.path.abspath(settings_path)
+                key_values[XAutomate.SETTINGS_FILE] = setting_filename
+            # every argument is substituted separately, so values with spaces stay one argument
+            arguments = [argument.substitute(command_values) for argument in self._command_template]
+            run_text += '\0' + '\0'.join(argument.substitute(key_values)
+                                         for argument in self._command_template)
+        else:
+            arguments = [settings_path]
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache.key(run_text, self._application_fingerprint)
+        cached_info = self._cache.fetch(cache_key, temp_dir) if cache_key is not None else None
+        cached = cached_info is not None
+        status = 'OK'
+        info = {'attempts': 0}
+        if cached:
+            info.update(cached_info)
+        else:
+            if self._settings_template is not None:
+                with open(settings_path, 'w') as \
+                        settings_file:
+                    settings_file.write(xml_text)
+            while True:
+                info['attempts'] += 1
+                if self._python:
+                    status, reason, returncode, resources, output = self._runPython(parameters, temp_dir)
+                elif self._warm is not None:
+                    status, reason, returncode, resources, output = self._runWarm(iteration, parameters,
+                                                                                  arguments,
+                                                                                  temp_dir)
+                elif self._resources is not None:
+                    allocation = self._resources.acquire(values)
+                    try:
+                        status, reason, returncode, resources, output = self._runApplication(iteration,
+                                                                                             arguments,
+                                                                                             temp_dir,
+                                                                                             allocation)
+                    finally:
+                        self._resources.release(allocation)
+                else:
+                    status, reason, returncode, resources, output = self._runApplication(iteration,
+                                                                                         arguments,
+                                                                                         temp_dir)
+                if status != 'FAIL' or self._retry is None or \
+                        info['attempts'] >= self._retry.attempts or \
+                        not self._retry.isTransient(reason, returncode, output):
+                    break
+                for filename in os.listdir(temp_dir):
+                    if filename != setting_filename:
+                        file_path = os.path.join(temp_dir, filename)
+                        if os.path.isdir(file_path) and not os.path.islink(file_path):
+                            shutil.rmtree(file_path)
+                        else:
+                            os.remove(file_path)
+                time.sleep(self._retry.delay(info['attempts']))
+            if reason is not None:
+                info['reason'] = reason
+            if status == 'FAIL':
+                last_lines = output.strip().splitlines()
+                if last_lines:
+                    info['output'] = last_lines[-1][-200:]
+            resources['written_bytes'] = sum(os.path.getsize(os.path.join(folder, f))
+                                             for folder, _, filenames in os.walk(temp_dir)
+                                             for f in filenames
+                                             if folder != temp_dir or f != setting_filename)
+            info.update(resources)
+            if cache_key is not None and status == 'OK':
+                self._cache.store(cache_key, temp_dir, resources)
+        return iteration, parameters, temp_dir, status, cached, info
+
+    def _kill(self, process, killed=None):
+        # the application runs in its own process group, so its children are stopped too
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        if killed is not None:
+            killed.append(True)
+
+    def _runApplication(self, iteration, arguments, temp_dir, allocation=None):
+        """Run the application once, on the CPUs of the allocation of Resources if it is given.
+
+    Returns the status, the reason of a failure, the exit code, the used resources and
+    the end of the output.
+    """
+        pruned = False
+        timed_out = []
+        output_file = self._output_log.open(os.path.join(temp_dir, self._orderer.getStdoutFilename()))
         try:
-            output = subprocess.check_output([self._application_path, settings_path], 
-                                             cwd=temp_dir,
-                                             stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as e:
-            output = e.output
-            failure = True
+            start = time.time()
+            environment = None
+            preexec = os.setsid
+            if allocation is not None:
+                environment = self._resources.environment(allocation)
+                preexec = lambda: (os.setsid(), Resources.pin(allocation[0]))
+            process = subprocess.Popen([self._application_path] + arguments,
+                                       cwd=temp_dir,
+                                       env=environment,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       preexec_fn=preexec)
+            timer = None
+            if self._timeout is not None:
+                timer = threading.Timer(self._timeout, self._kill, (process, timed_out))
+                timer.start()
+            try:
+                if self._pruner is None:
+                    for chunk in iter(lambda: os.read(process.stdout.fileno(), OutputLog.CHUNK_SIZE), ''):
+                        output_file.write(chunk)
+                else:
+                    # a long line is read in parts, only the first part of it is parsed
+                    line_start = True
+                    for line in iter(lambda: process.stdout.readline(OutputLog.CHUNK_SIZE), ''):
+                        output_file.write(line)
+                        progress = self._pruner.parse(line) if line_start else None
+                        line_start = line.endswith('\n')
+                        if progress is not None and self._pruner.report(iteration, *progress):
+                            pruned = True
+                            self._kill(process)
+                            break
+                    self._pruner.finish(iteration)
+                process.stdout.close()
+                resources = self._wait(process, start)
+            finally:
+                if timer is not None:
+                    timer.cancel()
         finally:
-            with open(os.path.join(temp_dir, self._orderer.getStdoutFilename()), 'w') as output_file:
-                output_file.write(output)
+            output_file.close()
+        output = output_file.tail()
+        if timed_out:
+            return 'FAIL', 'timeout after %s s' % self._timeout, process.returncode, resources, output
+        if pruned:
+            return 'PRUNED', 'pruned', process.returncode, resources, output
+        if process.returncode != 0:
+            return 'FAIL', 'exit code %d' % process.returncode, process.returncode, resources, output
+        return 'OK', None, process.returncode, resources, output
 
-        destination = self._orderer.orderFiles(iteration, parameters, temp_dir)
+    def _runPython(self, parameters, temp_dir):
+        """Call the Python target in the process pool. Returns the same as _runApplication."""
+        status, reason, resources = self._process_pool.apply(_runPythonTarget,
+            (temp_dir, parameters + self._fixed_parameters.items(),
+             self._application_path.results_filename, self._orderer.getStdoutFilename()))
+        return status, reason, None, resources, reason or ''
+
+    def _runWarm(self, iteration, parameters, arguments, temp_dir):
+        """Run a job on a persistent instance of the application. Returns the same as _runApplication."""
+        instance = self._warm.acquire(self._application_path)
+        pruned = False
+        timed_out = []
+        returncode = None
+        output_file = self._output_log.open(os.path.join(temp_dir, self._orderer.getStdoutFilename()))
+        start = time.time()
+        timer = None
+        if self._timeout is not None:
+            timer = threading.Timer(self._timeout, self._kill, (instance.process, timed_out))
+            timer.start()
         try:
-            os.rmdir(temp_dir)
-        except OSError as e:
-            print 'WARNING: Cannot delete temporary folder:\''+e.filename+'\''
-        return iteration, parameters, destination, failure
+            try:
+                instance.send(self._warm.job(temp_dir, arguments,
+                                             parameters + self._fixed_parameters.items()))
+                # a long line is read in parts, only the first part of it is parsed
+                line_start = True
+                for line in iter(lambda: instance.process.stdout.readline(OutputLog.CHUNK_SIZE), ''):
+                    part_start, line_start = line_start, line.endswith('\n')
+                    if part_start and line.split('\t', 1)[0].rstrip('\n') == 'DONE':
+                        fields = line.rstrip('\n').split('\t')
+                        returncode = int(fields[1]) if len(fields) > 1 else 0
+                        if len(fields) > 2 and os.path.abspath(fields[2]) != os.path.abspath(temp_dir):
+                            for filename in os.listdir(fields[2]):
+                                shutil.move(os.path.join(fields[2], filename), temp_dir)
+                        break
+                    output_file.write(line)
+                    if self._pruner is not None and part_start:
+                        progress = self._pruner.parse(line)
+                        if progress is not None and self._pruner.report(iteration, *progress):
+                            pruned = True
+                            break
+            except IOError:
+                # the instance has crashed before reading the job
+                pass
+            finally:
+                if self._pruner is not None:
+                    self._pruner.finish(iteration)
+                if timer is not None:
+                    timer.cancel()
+        finally:
+            output_file.close()
+        resources = {'wall_time': round(time.time() - start, 3)}
+        self._warm.release(instance, restart=returncode is None)
+        output = output_file.tail()
+        if timed_out:
+            return 'FAIL', 'timeout after %s s' % self._timeout, returncode, resources, output
+        if pruned:
+            return 'PRUNED', 'pruned', returncode, resources, output
+        if returncode is None:
+            return 'FAIL', 'worker crashed', returncode, resources, output
+        if returncode != 0:
+            return 'FAIL', 'exit code %d' % returncode, returncode, resources, output
+        return 'OK', None, returncode, resources, output
 
-    def execute(self, processes=None):
-        """Execute automation using n processes.
+    def _wait(self, process, start):
+        """Wait for the application and collect the resources used by it and its waited children.
+
+    The application is executed in a process forked from this one, so its peak memory is at
+    least the memory of this process at the start of the run. Only a larger peak memory is
+    the peak memory of the application itself.
+    """
+        _, exit_status, usage = os.wait4(process.pid, 0)
+        wall_time = time.time() - start
+        if os.WIFSIGNALED(exit_status):
+            process.returncode = -os.WTERMSIG(exit_status)
+        else:
+            process.returncode = os.WEXITSTATUS(exit_status)
+        # maximal resident set size is reported in kilobytes on Linux and in bytes on OS X
+        max_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        return {'wall_time': round(wall_time, 3), 'user_time': round(usage.ru_utime, 3),
+                'system_time': round(usage.ru_stime, 3), 'max_rss': max_rss}
+
+    def _readStats(self, stats_path):
+        """Read the stats journal of a previous execution.
+
+    Returns the header with parameter names, the run records and the byte offset
+    right after the last complete record. A trailing line cut off by a crash is
+    not part of the result.
+    """
+        names, records, offset = None, [], 0
+        with open(stats_path, 'rb') as stats_file:
+            for line in iter(stats_file.readline, ''):
+                if not line.endswith('\n'):
+                    break
+                try:
+                    if names is None:
+                        version, names = StatsJournal.parseHeader(line)
+                    else:
+                        records.append(StatsJournal.parseRecord(line, version))
+                except (ValueError, SyntaxError):
+                    break
+                offset = stats_file.tell()
+        return names, records, offset
+
+    def _completedRuns(self, stats_path, kept=()):
+        """Collect (iteration, parameter values) of runs finished OK in a previous execution.
+
+    A run counts as completed only if its record in the journal has the 'OK' status
+    and its files are still present in the ordered output tree or in its archive. The journal is
+    truncated after the last complete record, so new records can be appended. Records of runs
+    computed again are removed from it, so every run has a single record.
 
     Args:
-        processes: Number of separate processes to run
+        stats_path: Path of the journal
+        kept: (iteration, parameter values) of runs not computed again, e.g. quarantined runs
+    """
+        names, records, offset = self._readStats(stats_path)
+        if names is None:
+            return set()
+        if names != tuple(p.name for p in self._parameters):
+            sys.exit('Terminated. Parameters ' + str(names) + ' of the stats file \'' + \
+                stats_path + '\' do not match the specified parameters.')
+        listings = {}
+        completed = set()
+        for record in records:
+            prefix, status, path, param_values = record[:4]
+            if status != 'OK':
+                continue
+            if path not in listings:
+                destination = os.path.join(self._output_path, path)
+                if os.path.isdir(destination):
+                    listings[path] = set(f.split('_', 1)[0] for f in os.listdir(destination))
+                elif os.path.isfile(destination + ArchiveIndex.EXTENSION):
+                    # files of runs packed by ArchiveOrderer
+                    listings[path] = set(prefix for prefix, _ in ArchiveIndex.read(destination))
+                else:
+                    listings[path] = set()
+            if prefix in listings[path]:
+                completed.add((int(prefix), param_values))
+        # the last record of a run supersedes its earlier records
+        last = dict(((int(record[0]), record[3]), index) for index, record in enumerate(records))
+        retained = sorted(index for run, index in last.items() if run in completed or run in kept)
+        if len(retained) == len(records):
+            with open(stats_path, 'r+b') as stats_file:
+                stats_file.truncate(offset)
+            return completed
+        temp_path = stats_path + '.part'
+        with open(temp_path, 'w') as stats_file:
+            stats_file.write(StatsJournal.header(names))
+            for index in retained:
+                stats_file.write(StatsJournal.record(*records[index]))
+            stats_file.flush()
+            os.fsync(stats_file.fileno())
+        os.rename(temp_path, stats_path)
+        return completed
+
+    def _statsFilename(self, shard=None, num_shards=None, name='stats'):
+        if num_shards is None:
+            return os.path.join(self._output_path, name + '.txt')
+        return os.path.join(self._output_path,
+                            name + '.shard-{:d}-of-{:d}.txt'.format(shard, num_shards))
+
+    def _quarantinedRuns(self, quarantine_path):
+        names, records, _ = self._readStats(quarantine_path)
+        if names is not None and names != tuple(p.name for p in self._parameters):
+            sys.exit('Terminated. Parameters ' + str(names) + ' of the quarantine file \'' + \
+                quarantine_path + '\' do not match the specified parameters.')
+        return set((int(record[0]), record[3]) for record in records)
+
+    def _writeQuarantine(self, quarantine_path, result):
+        new_file = not os.path.isfile(quarantine_path)
+        with open(quarantine_path, 'a') as quarantine:
+            if new_file:
+                quarantine.write(StatsJournal.header(p.name for p in self._parameters))
+            self._writeStats(quarantine, result)
+
+    def mergeShardStats(self, num_shards):
+        """Merge stats journals of all shards of an execution into a single 'stats.txt'.
+
+    Records are sorted by iteration. If an iteration was recorded several times
+    (e.g. after resuming), the last record is taken.
+
+    Args:
+        num_shards: Number of shards the execution was split into
     """
-    
+        names = None
+        records = {}
+        for shard in range(num_shards):
+            shard_path = self._statsFilename(shard, num_shards)
+            if not os.path.isfile(shard_path):
+                print 'WARNING: Stats file of the shard %i is not found: \'%s\'' % (shard, shard_path)
+                continue
+            shard_names, shard_records, _ = self._readStats(shard_path)
+            if names is not None and shard_names is not None and shard_names != names:
+                sys.exit('Terminated. Stats file \'' + shard_path + '\' has different parameters ' + \
+                    str(shard_names) + '.')
+            names = names or shard_names
+            for record in shard_records:
+                records[int(record[0])] = record
+        if names is None:
+            sys.exit('Terminated. There are no stats files of shards to merge.')
+        with open(self._statsFilename(), 'w') as stats:
+            stats.write(StatsJournal.header(names))
+            for iteration in sorted(records):
+                stats.write(StatsJournal.record(*records[iteration]))
+        print 'Merged %i records of %i shards.' % (len(records), num_shards)
+
+    def _readMetrics(self, iteration, destination, results_filename):
+        if isinstance(self._orderer, ArchiveOrderer):
+            content = self._orderer.readFile(iteration, results_filename, destination)
+            if content is None:
+                return None
+            lines = content.splitlines()
+        else:
+            results_path = os.path.join(destination, self._orderer.getIterationPrefix(iteration) + \
+                '_' + results_filename)
+            try:
+                with open(results_path, 'r') as results_file:
+                    lines = results_file.readlines()
+            except IOError:
+                return None
+        metrics = {}
+        for line in lines:
+            pair = line.split()
+            if len(pair) < 2:
+                continue
+            try:
+                metrics[pair[0]] = float(pair[1])
+            except ValueError:
+                pass
+        return metrics
+
+    def _runSafe(self, job):
+        try:
+            return self._run(job)
+        except Exception as e:
+            return e
+
+    def _resumeSampler(self, sampler, stats_path, space, evaluated):
+        """Update the sampler by the metrics of the runs computed in a previous execution."""
+        _, records, _ = self._readStats(stats_path)
+        for record in records:
+            prefix, status, path, param_values = record[:4]
+            iteration = int(prefix)
+            if iteration not in evaluated or space.values(iteration) != param_values:
+                continue
+            metrics = None
+            if status == 'OK':
+                metrics = self._readMetrics(iteration, os.path.join(self._output_path, path),
+                                            sampler.results_filename)
+            sampler.update(iteration, metrics)
+
+    def _sample(self, pool, processes, sampler, space):
+        results = Queue.Queue()
+        in_flight = 0
+        while True:
+            while in_flight < processes:
+                iteration = sampler.next()
+                if iteration is None:
+                    break
+                pool.apply_async(self._runSafe, ((iteration, space[iteration]),), callback=results.put)
+                in_flight += 1
+            if in_flight == 0:
+                return
+            result = results.get()
+            in_flight -= 1
+            if isinstance(result, Exception):
+                raise result
+            metrics = None
+            if result[3] == 'OK' and sampler.results_filename is not None:
+                metrics = self._readMetrics(result[0], result[2], sampler.results_filename)
+            sampler.update(result[0], metrics)
+            yield result
+
+    def _writeStats(self, stats, result):
+        relative_path = os.path.relpath(result[2], self._output_path)
+        stats.write(StatsJournal.record(self._orderer.getIterationPrefix(result[0]), result[3],
+            relative_path, [value for _, value in result[1]], result[5]))
+        stats.flush()
+        os.fsync(stats.fileno())
+
+    def _printProgress(self, done, count, fails):
+        print '\rDone: {:d}/{:d} ({:.0%}) Fails: {:d}'.format(done, count,
+            done/float(count), fails),
+        sys.stdout.flush()
+
+    def _prepare(self, processes=None):
         settings = self._read_settings()
         self._validateTemplateAndParameters(settings)
-        self._settings_template = Template(settings)
-        comb_count = sum(1 for _ in self._combinations(self._parameters))
-        self._orderer.init(self._settings_path, self._output_path, comb_count)
-        pool = ThreadPool(processes=processes)
-        pool_iterator = pool.imap_unordered(self._run, 
-                                            enumerate(self._combinations(self._parameters)))
-        print "Xautomate starts... There are %i parameter combinations." % comb_count
-        done = 0
+        self._settings_template = Template(settings) if settings is not None else None
+        self._command_template = None
+        if self._command is not None:
+            self._command_template = [Template(argument) for argument in shlex.split(self._command)]
+        if self._cache is not None:
+            if self._python:
+                self._application_fingerprint = self._cache.fingerprint(
+                    self._application_path.sourcePath())
+            else:
+                self._application_fingerprint = self._cache.fingerprint(self._application_path)
+        if self._python:
+            # started before threads of the execution, so worker processes are forked without them
+            self._process_pool = multiprocessing.Pool(processes, _initPythonTarget,
+                (self._application_path.function, self._application_path.initializer))
+
+    def _finish(self):
+        if self._process_pool is not None:
+            self._process_pool.close()
+            self._process_pool.join()
+            self._process_pool = None
+        self._orderer.clean()
+
+    def _connect(self, address):
+        if isinstance(address, basestring):
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(address)
+        else:
+            connection = socket.create_connection(address)
+        stream = connection.makefile('rw')
+        connection.close()
+        return stream
+
+    def _request(self, stream, message):
+        try:
+            stream.write(json.dumps(message) + '\n')
+            stream.flush()
+            reply = stream.readline()
+        except socket.error:
+            return None
+        return json.loads(reply) if reply else None
+
+    def _workLoop(self, address, space):
+        stream = self._connect(address)
+        try:
+            self._request(stream, {'type': 'hello'})
+            while True:
+                reply = self._request(stream, {'type': 'get'})
+                # the coordinator closes the connection when the execution is finished
+                if reply is None or reply['type'] == 'stop':
+                    break
+                if reply['type'] == 'wait':
+                    time.sleep(1.0)
+                    continue
+                result = self._run((reply['iteration'], space[reply['iteration']]))
+                self._request(stream, {'type': 'result', 'iteration': result[0],
+                                       'destination': os.path.relpath(result[2], self._output_path),
+                                       'status': result[3], 'cached': result[4],
+                                       'info': result[5]})
+        finally:
+            try:
+                stream.close()
+            except socket.error:
+                pass
+
+    def work(self, address, processes=1):
+        """Compute combinations served by an execution in the coordinator mode.
+
+    The worker has to be set up with the same parameters as the coordinator. The output
+    path is expected to be shared between them.
+
+    Args:
+        address: (host, port) or path of the Unix socket of the coordinator
+        processes: Number of separate processes to run
+    """
+        self._prepare(processes)
+        space = ParameterSpace(self._parameters)
+        stream = self._connect(address)
+        hello = self._request(stream, {'type': 'hello'})
+        stream.close()
+        if hello is None or tuple(hello['names']) != space.names or hello['count'] != len(space):
+            sys.exit('Terminated. Parameters of the worker do not match parameters of the coordinator.')
+        self._orderer.init(self._settings_path, self._output_path, len(space))
+        self._orderer.checkParameters(self._parameters)
+        print "Xautomate worker starts %i processes..." % processes
+        threads = [threading.Thread(target=self._workLoop, args=(address, space))
+                   for _ in range(processes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._finish()
+
+    def execute(self, processes=None, resume=False, shard=None, num_shards=None,
+                coordinator=None, lease_timeout=None, sampler=None, pruner=None,
+                timeout=None, retry=None, retry_quarantined=False, output_log=None, warm=None,
+                transfer=None, cost_model=None, resources=None):
+        """Execute automation using n processes.
+
+    Args:
+        processes: Number of separate processes to run
+        resume: Continue an interrupted execution. Combinations recorded as OK in
+                the existing 'stats.txt' are not computed again.
+        shard: Index of the part of combinations to compute when the execution is split
+               between several machines, from 0 to num_shards - 1. Default: environment
+               variable XAUTOMATE_SHARD
+        num_shards: Number of parts the execution is split into. Every shard computes each
+                    num_shards-th combination and writes its own 'stats.shard-i-of-K.txt',
+                    which are combined by mergeShardStats(). Default: environment variable
+                    XAUTOMATE_NUM_SHARDS
+        coordinator: Serve combinations to workers started with work() on the (host, port) or
+                     Unix socket path instead of computing them in a local pool. In this mode
+                     processes is the number of local workers, None: no local workers
+        lease_timeout: Seconds after which a combination served to a worker, which is still
+                       connected but not reporting, is served again. None: never
+        sampler: Sampler class to compute only a budget of combinations chosen by a search
+                 strategy (RandomSampler, LatinHypercubeSampler, ModelBasedSampler).
+                 None: all combinations
+        pruner: Pruner class to stop runs, whose progress reported in the output is worse than
+                progress of other runs (MedianPruner, SuccessiveHalvingPruner). Such runs are
+                recorded with the 'PRUNED' status. None: no pruning
+        timeout: Wall-clock time limit of a run in seconds. The application and all its
+                 child processes are killed when it is exceeded. None: no limit
+        retry: RetryPolicy class to repeat runs failed for transient reasons. Runs, which
+               still fail, are put into the quarantine file 'quarantine.txt' and are not
+               computed again on resume. None: no repetition
+        retry_quarantined: Compute the quarantined combinations again on resume
+        output_log: OutputLog class to limit or compress the saved output of the application.
+                    None: the whole output is saved uncompressed
+        warm: WarmWorkers class to compute runs on persistent instances of the application
+              instead of starting it for every run. None: one process per run
+        transfer: Transfer class to compute runs in a local scratch folder and move their files
+                  to the output path in the background. A run is recorded in 'stats.txt' when
+                  its files are moved. None: runs are computed in the output path
+        cost_model: CostModel class to compute the combinations with the longest expected run
+                    time first. The predicted and the actual makespan are reported.
+                    None: combinations are computed in their order
+        resources: Resources class to start a run only when the CPUs and the memory it needs are
+                   free, and to pin it to its CPUs. processes is then the maximal number of
+                   concurrent runs, None: the number of CPUs. None: processes runs at a time
+    """
+        if shard is None and 'XAUTOMATE_SHARD' in os.environ:
+            shard = int(os.environ['XAUTOMATE_SHARD'])
+        if num_shards is None and 'XAUTOMATE_NUM_SHARDS' in os.environ:
+            num_shards = int(os.environ['XAUTOMATE_NUM_SHARDS'])
+        if (shard is None) != (num_shards is None) or \
+                (num_shards is not None and not 0 <= shard < num_shards):
+            sys.exit('Terminated. Wrong shard %s of %s shards.' % (shard, num_shards))
+        if sampler is not None and (num_shards is not None or coordinator is not None):
+            sys.exit('Terminated. A sampler cannot be used with shards or a coordinator.')
+        if transfer is not None and (sampler is not None or coordinator is not None):
+            sys.exit('Terminated. A transfer cannot be used with a sampler or a coordinator.')
+        if cost_model is not None and sampler is not None:
+            sys.exit('Terminated. A cost model cannot be used with a sampler.')
+        if resources is not None and (self._python or warm is not None):
+            sys.exit('Terminated. Resources can be allocated only to runs of the application.')
+        if resources is not None and processes is None:
+            processes = len(resources.cpus)
+        self._pruner = pruner
+        self._timeout = timeout
+        self._retry = retry
+        self._output_log = output_log or OutputLog()
+        self._warm = warm
+        self._resources = resources
+
+        self._prepare(processes)
+        stats_path = self._statsFilename(shard, num_shards)
+        quarantine_path = self._statsFilename(shard, num_shards, 'quarantine')
+        for journal_path in (stats_path, quarantine_path):
+            # new records are appended in the current format
+            if resume and os.path.isfile(journal_path) and StatsJournal.version(journal_path) == 1:
+                print 'Converting \'%s\' to the current format.' % journal_path
+                StatsJournal.convert(journal_path)
+        quarantined = set()
+        if retry is not None and resume and not retry_quarantined and os.path.isfile(quarantine_path):
+            quarantined = self._quarantinedRuns(quarantine_path)
+        elif os.path.isfile(quarantine_path) and (not resume or retry_quarantined):
+            os.remove(quarantine_path)
+        completed = set()
+        if resume and os.path.isfile(stats_path):
+            completed = self._completedRuns(stats_path, quarantined)
+        quarantined -= completed
+        completed = completed | quarantined
+        space = ParameterSpace(self._parameters)
+        comb_count = len(space)
+        evaluated = set(iteration for iteration, values in completed
+                        if iteration < comb_count and space.values(iteration) == values)
+        skipped = len(evaluated)
+        self._orderer.init(self._settings_path, self._output_path, comb_count,
+                           transfer.scratch_path if transfer is not None else None)
+        self._orderer.checkParameters(self._parameters)
+        if sampler is not None:
+            sampler.init(space, evaluated)
+            if sampler.results_filename is not None and skipped > 0:
+                self._resumeSampler(sampler, stats_path, space, evaluated)
+            comb_count = min(sampler.budget, comb_count)
+        elif num_shards is None:
+            combinations = enumerate(space)
+        else:
+            combinations = ((i, space[i]) for i in xrange(shard, comb_count, num_shards))
+            comb_count = len(xrange(shard, comb_count, num_shards))
+        # the sampler excludes completed combinations itself
+        if sampler is None and skipped > 0:
+            combinations = ((i, c) for i, c in combinations
+                            if (i, tuple(value for _, value in c)) not in completed)
+        if cost_model is not None:
+            # the journal of this execution is read before it is rewritten
+            for history_path in cost_model.history or [stats_path]:
+                if os.path.isfile(history_path):
+                    names, records, _ = self._readStats(history_path)
+                    cost_model.learn(names, records)
+            combinations, predicted = cost_model.schedule(list(combinations),
+                                                          self._fixed_parameters,
+                                                          processes or multiprocessing.cpu_count())
+        start = time.time()
+        if sampler is not None:
+            pool = ThreadPool(processes=processes)
+            pool_iterator = self._sample(pool, processes or multiprocessing.cpu_count(), sampler, space)
+        elif coordinator is None:
+            pool = ThreadPool(processes=processes)
+            if transfer is not None:
+                # set before the pool starts runs
+                transfer.init(processes or multiprocessing.cpu_count())
+                self._transfer = transfer
+            pool_iterator = pool.imap_unordered(self._run, combinations)
+            if transfer is not None:
+                pool_iterator = transfer.land(pool_iterator, self._place)
+        else:
+            server = Coordinator(coordinator, self._output_path, combinations, space.names, len(space), lease_timeout)
+            pool_iterator = server.results(comb_count - skipped)
+            print "Xautomate coordinator serves on %s." % str(server.address)
+            workers = [threading.Thread(target=self._workLoop, args=(server.localAddress(), space))
+                       for _ in range(processes or 0)]
+            for worker in workers:
+                worker.start()
+        if sampler is not None:
+            print "Xautomate starts... Sampling %i of %i parameter combinations." % \
+                (comb_count, len(space))
+        elif num_shards is None:
+            print "Xautomate starts... There are %i parameter combinations." % comb_count
+        else:
+            print "Xautomate starts shard %i of %i... There are %i parameter combinations." % \
+                (shard, num_shards, comb_count)
+        if skipped > 0:
+            print "Resuming. %i combinations are already computed." % (skipped - len(quarantined))
+        if len(quarantined) > 0:
+            print "%i combinations are quarantined." % len(quarantined)
+        done = skipped
         fails = 0
+        pruned = 0
+        cached = 0
         stats = ''
-        with open(os.path.join(self._output_path, 'stats.txt'), 'w') as stats:
-            stats.write(repr(tuple(p.name for p in self._parameters))+'\n')
-            print 'Done: {:d}/{:d} ({:.0%}) Fails: {:d}'.format(done, comb_count,
-                done/float(comb_count), fails),
+        new_journal = not resume or not os.path.isfile(stats_path) or os.path.getsize(stats_path) == 0
+        with open(stats_path, 'w' if new_journal else 'a') as stats:
+            if new_journal:
+                stats.write(StatsJournal.header(p.name for p in self._parameters))
+            self._printProgress(done, comb_count, fails)
             for result in pool_iterator:
                 done += 1
-                if result[3]:
+                if result[3] == 'FAIL':
                     fails += 1
-                status = 'OK' if not result[3] else 'FAIL'
-                relative_path = os.path.relpath(result[2], self._output_path)
-                stats.write(repr((self._orderer.getIterationPrefix(result[0]), status, relative_path,
-                    tuple(value for _, value in result[1]))) + '\n')
-                print '\rDone: {:d}/{:d} ({:.0%}) Fails: {:d}'.format(done, comb_count,
-                    done/float(comb_count), fails),
-                sys.stdout.flush()
+                    if retry is not None:
+                        self._writeQuarantine(quarantine_path, result)
+                elif result[3] == 'PRUNED':
+                    pruned += 1
+                if result[4]:
+                    cached += 1
+                self._writeStats(stats, result)
+                self._printProgress(done, comb_count, fails)
             print
-        self._orderer.clean()
+        if coordinator is not None:
+            for worker in workers:
+                worker.join()
+            server.close()
+        if self._cache is not None:
+            print 'Results of %i combinations are taken from the cache.' % cached
+        if self._pruner is not None:
+            print '%i runs are pruned.' % pruned
+        if cost_model is not None:
+            print 'Makespan: predicted %.1f s, actual %.1f s.' % (predicted, time.time() - start)
+        if self._warm is not None:
+            self._warm.close()
+        self._transfer = None
+        self._finish()
+
+    def executeRefinement(self, metric, results_filename='results.txt', minimize=True, top=1,
+                          factor=2, rounds=3, min_step=None, budget=None, processes=None):
+        """Execute automation on the coarse grid of parameters and refine it around the best results.
+
+    Every round computes finer grids of linear and progression parameters around each of
+    the top best combinations so far, with the step divided by factor. Other parameters
+    keep the values of these combinations. All rounds are recorded in one 'stats.txt'.
+
+    Args:
+        metric: Name of the metric in the results file to optimize
+        results_filename: Name of the results file of the application
+        minimize: Look for the minimum of the metric, otherwise for the maximum
+        top: Number of best combinations to refine around
+        factor: Integer step reduction in every round
+        rounds: Maximal number of refinement rounds
+        min_step: Dictionary of the smallest steps of parameters, a parameter is not refined
+                  below it. The step of a progression parameter is a ratio
+        budget: Maximal number of computed combinations. None: no limit
+        processes: Number of separate processes to run
+    """
+        self._prepare(processes)
+        space = ParameterSpace(self._parameters)
+        refined = [i for i, p in enumerate(self._parameters)
+                   if isinstance(p, (LinearParameter, ProgressionParameter))]
+        if len(refined) == 0:
+            sys.exit('Terminated. There are no linear or progression parameters to refine.')
+        min_step = min_step or {}
+        steps = dict((i, self._parameters[i].step()) for i in refined)
+        # a value generated in several rounds is always written as it was written first
+        spellings = dict((i, dict((Decimal(v), v) for v in reversed(self._parameters[i].values())))
+                         for i in refined)
+        count = len(space) + rounds * top * (2 * factor + 1) ** len(refined)
+        if budget is not None:
+            count = min(count, budget)
+        self._orderer.init(self._settings_path, self._output_path, count)
+        self._orderer.checkParameters(self._parameters)
+        pool = ThreadPool(processes=processes)
+        evaluated = {}
+        iteration = 0
+        fails = 0
+        combinations = list(space)
+        print "Xautomate starts refinement... There are at most %i parameter combinations." % count
+        with open(self._statsFilename(), 'w') as stats:
+            stats.write(StatsJournal.header(p.name for p in self._parameters))
+            for round_index in range(rounds + 1):
+                if budget is not None:
+                    combinations = combinations[:budget - iteration]
+                if len(combinations) == 0:
+                    break
+                print 'Round %i: %i parameter combinations.' % (round_index, len(combinations))
+                pool_iterator = pool.imap_unordered(self._run,
+                    [(iteration + j, c) for j, c in enumerate(combinations)])
+                iteration += len(combinations)
+                done = 0
+                self._printProgress(done, len(combinations), fails)
+                for result in pool_iterator:
+                    done += 1
+                    metrics = None
+                    if result[3] != 'OK':
+                        fails += 1
+                    else:
+                        metrics = self._readMetrics(result[0], result[2], results_filename)
+                    self._writeStats(stats, result)
+                    self._printProgress(done, len(combinations), fails)
+                    value = float('inf')
+                    if metrics is not None and metric in metrics:
+                        value = metrics[metric] if minimize else -metrics[metric]
+                    evaluated[self._refinementKey(result[1], refined)] = (value, result[1])
+                print
+                active = []
+                for i in refined:
+                    finer = self._parameters[i].finerStep(steps[i], factor)
+                    if finer >= Decimal(str(min_step.get(self._parameters[i].name, 0))):
+                        steps[i] = finer
+                        active.append(i)
+                if len(active) == 0:
+                    break
+                combinations = []
+                for _, center in sorted(evaluated.values(), key=lambda e: e[0])[:top]:
+                    axes = []
+                    for i, (name, value) in enumerate(center):
+                        if i in active:
+                            axes.append([(name, spellings[i].setdefault(Decimal(v), v)) for v in
+                                         self._parameters[i].around(value, steps[i], factor)])
+                        else:
+                            axes.append([(name, value)])
+                    for combination in itertools.product(*axes):
+                        key = self._refinementKey(combination, refined)
+                        if key not in evaluated:
+                            evaluated[key] = (float('inf'), list(combination))
+                            combinations.append(list(combination))
+        best = sorted(evaluated.values(), key=lambda e: e[0])[0]
+        print 'Best %s: %s %s' % (metric, best[0] if minimize else -best[0],
+                                  ' '.join('%s=%s' % pair for pair in best[1]))
+        self._finish()
+
+    def _refinementKey(self, combination, refined):
+        return tuple(Decimal(value) if i in refined else value
+                     for i, (_, value) in enumerate(combination))
+
+
+class _CoordinatorHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        coordinator.connect(self)
+        try:
+            for line in iter(self.rfile.readline, ''):
+                message = json.loads(line)
+                if message['type'] == 'hello':
+                    reply = {'type': 'hello', 'names': coordinator.names, 'count': coordinator.count}
+                elif message['type'] == 'get':
+                    iteration = coordinator.assign(self)
+                    if iteration in ('wait', 'stop'):
+                        reply = {'type': iteration}
+                    else:
+                        reply = {'type': 'job', 'iteration': iteration}
+                else:
+                    coordinator.complete(message['iteration'], str(message['destination']),
+                                         str(message['status']), message['cached'],
+                                         dict((str(k), v) for k, v in message['info'].items()))
+                    reply = {'type': 'ok'}
+                self.wfile.write(json.dumps(reply) + '\n')
+                self.wfile.flush()
+        except socket.error:
+            pass
+        finally:
+            coordinator.release(self)
+
+
+class _CoordinatorTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _CoordinatorUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class Coordinator(object):
+    """Serve combinations of an execution to workers and collect their results.
+
+    Workers talk JSON lines over a TCP or Unix socket: 'hello' returns parameter names and
+    the number of combinations, 'get' returns the next iteration to compute (or asks to
+    wait or stop) and 'result' reports a finished iteration. Combinations of workers which
+    disconnect or exceed the lease timeout are served again.
+    """
+    def __init__(self, address, output_path, combinations, names, count, lease_timeout=None):
+        self.names = names
+        self.count = count
+        self._output_path = output_path
+        self._combinations = iter(combinations)
+        self._lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._exhausted = False
+        self._combination = {}
+        self._assigned = {}
+        self._requeued = deque()
+        self._finished = set()
+        self._workers = set()
+        self._results = Queue.Queue()
+        if isinstance(address, basestring):
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = _CoordinatorUnixServer(address, _CoordinatorHandler)
+        else:
+            self._server = _CoordinatorTCPServer(address, _CoordinatorHandler)
+        self._server.coordinator = self
+        self.address = self._server.server_address
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def localAddress(self):
+        if isinstance(self.address, basestring) or self.address[0] not in ('', '0.0.0.0'):
+            return self.address
+        return ('127.0.0.1', self.address[1])
+
+    def assign(self, worker):
+        with self._lock:
+            now = time.time()
+            if self._lease_timeout is not None:
+                for iteration, (owner, start) in self._assigned.items():
+                    if now - start > self._lease_timeout:
+                        del self._assigned[iteration]
+                        self._requeued.append(iteration)
+            iteration = None
+            while self._requeued and iteration is None:
+                iteration = self._requeued.popleft()
+                if iteration in self._finished:
+                    iteration = None
+            if iteration is None and not self._exhausted:
+                try:
+                    iteration, combination = next(self._combinations)
+                    self._combination[iteration] = combination
+                except StopIteration:
+                    self._exhausted = True
+            if iteration is None:
+                return 'wait' if self._combination else 'stop'
+            self._assigned[iteration] = (worker, now)
+            return iteration
+
+    def complete(self, iteration, destination, status, cached, info):
+        with self._lock:
+            if iteration in self._finished:
+                return
+            self._finished.add(iteration)
+            self._assigned.pop(iteration, None)
+            combination = self._combination.pop(iteration)
+        self._results.put((iteration, combination,
+                           os.path.join(self._output_path, destination), status, cached, info))
+
+    def connect(self, worker):
+        with self._lock:
+            self._workers.add(worker)
+
+    def release(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+            for iteration, (owner, _) in self._assigned.items():
+                if owner is worker:
+                    del self._assigned[iteration]
+                    self._requeued.append(iteration)
+
+    def results(self, count):
+        """Yield results of count combinations as they are reported."""
+        for _ in range(count):
+            while True:
+                try:
+                    result = self._results.get(timeout=1.0)
+                    break
+                except Queue.Empty:
+                    pass
+            yield result
+
+    def close(self):
+        """Stop serving and disconnect remaining workers."""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class ResultCache(object):
+    def __init__(self, path, max_size=None):
+        """Setup cache of computed results.
+
+    Results are keyed by the substituted settings and the content of the application,
+    so a combination is computed only once, also across different executions.
+
+    Args:
+        path: Directory to keep the cached results
+        max_size: Size limit of the cache in bytes. The least recently used results are evicted
+                  when it is exceeded. None: no limit
+    """
+        self._path = path
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None
+        if not os.path.exists(self._path) or not os.path.isdir(self._path):
+            try:
+                os.makedirs(self._path)
+            except OSError as e:
+                sys.exit('Terminated. Cannot create directory \'' + self._path +'\'.')
+
+    def fingerprint(self, application_path):
+        sha = hashlib.sha1()
+        with open(application_path, 'rb') as application_file:
+            for chunk in iter(lambda: application_file.read(1 << 20), ''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def key(self, settings, fingerprint):
+        return hashlib.sha1(fingerprint + '\0' + settings).hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self._path, key[:2], key)
+
+    def _entrySize(self, entry):
+        return sum(os.path.getsize(os.path.join(folder, f))
+                   for folder, _, filenames in os.walk(entry) for f in filenames)
+
+    def _link(self, source, destination):
+        if os.path.isdir(source):
+            # folders written by the application are linked file by file
+            os.mkdir(destination)
+            for filename in os.listdir(source):
+                self._link(os.path.join(source, filename), os.path.join(destination, filename))
+            return
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+
+    INFO_FILENAME = '.info'
+
+    def fetch(self, key, path):
+        """Place cached results of the run into path.
+
+    Returns the resources used by the original run or None on a cache miss.
+    """
+        entry = self._entryPath(key)
+        info = {}
+        with self._lock:
+            if not os.path.isdir(entry):
+                return None
+            try:
+                for filename in os.listdir(entry):
+                    if filename == ResultCache.INFO_FILENAME:
+                        with open(os.path.join(entry, filename), 'r') as info_file:
+                            info = ast.literal_eval(info_file.read())
+                    else:
+                        self._link(os.path.join(entry, filename), os.path.join(path, filename))
+                os.utime(entry, None)
+            except (OSError, IOError):
+                # entry is evicted by another process
+                for filename in os.listdir(path):
+                    file_path = os.path.join(path, filename)
+                    if os.path.isdir(file_path) and not os.path.islink(file_path):
+                        shutil.rmtree(file_path)
+                    else:
+                        os.remove(file_path)
+                return None
+        return info
+
+    def store(self, key, path, info=None):
+        entry = self._entryPath(key)
+        with self._lock:
+            if os.path.isdir(entry):
+                return
+            if not os.path.isdir(os.path.dirname(entry)):
+                os.makedirs(os.path.dirname(entry))
+            staging = tempfile.mkdtemp(dir=self._path)
+            for filename in os.listdir(path):
+                self._link(os.path.join(path, filename), os.path.join(staging, filename))
+            if info is not None:
+                with open(os.path.join(staging, ResultCache.INFO_FILENAME), 'w') as info_file:
+                    info_file.write(repr(info))
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # stored by another process
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+            if self._size is not None:
+                self._size += self._entrySize(entry)
+        if self._max_size is not None:
+            self.prune()
+
+    def entries(self):
+        """List cached results as (key, size, last usage time) tuples, the most recently used first."""
+        entries = []
+        for bucket in os.listdir(self._path):
+            bucket_path = os.path.join(self._path, bucket)
+            if len(bucket) != 2 or not os.path.isdir(bucket_path):
+                continue
+            for key in os.listdir(bucket_path):
+                entry = os.path.join(bucket_path, key)
+                entries.append((key, self._entrySize(entry), os.path.getmtime(entry)))
+        return sorted(entries, key=lambda e: e[2], reverse=True)
+
+    def size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(e[1] for e in self.entries())
+            return self._size
+
+    def prune(self, max_size=None):
+        """Evict the least recently used results until the cache fits into max_size bytes.
+
+    Args:
+        max_size: Size limit in bytes. None: the limit of the cache
+    Returns:
+        Number of evicted results
+    """
+        if max_size is None:
+            max_size = self._max_size
+        if max_size is None:
+            return 0
+        evicted = 0
+        with self._lock:
+            if self._size is not None and self._size <= max_size:
+                return 0
+            entries = self.entries()
+            self._size = sum(e[1] for e in entries)
+            while self._size > max_size and entries:
+                key, size, _ = entries.pop()
+                shutil.rmtree(self._entryPath(key), ignore_errors=True)
+                self._size -= size
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        return self.prune(max_size=0)
+
+
+class ParameterSpace(object):
+    """Cartesian product of parameters addressed by a mixed-radix index.
+
+    The last parameter changes the fastest, so index i is the i-th combination of the
+    nested iteration over all parameters. A combination is a list of (name, value) pairs.
+    """
+    def __init__(self, parameters):
+        self._parameters = tuple(parameters)
+        self._radices = tuple(len(p) for p in self._parameters)
+        self._strides = []
+        stride = 1
+        for radix in reversed(self._radices):
+            self._strides.insert(0, stride)
+            stride *= radix
+        self._size = stride if self._parameters else 0
+
+    @property
+    def names(self):
+        return tuple(p.name for p in self._parameters)
+
+    @property
+    def shape(self):
+        return self._radices
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        pairs = [[(p.name, value) for value in p.values()] for p in self._parameters]
+        if not pairs:
+            return iter([])
+        return itertools.imap(list, itertools.product(*pairs))
+
+    def digits(self, index):
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError('Combination index out of range')
+        return tuple((index // stride) % radix for stride, radix in zip(self._strides, self._radices))
+
+    def compose(self, digits):
+        """Index of the combination with the given value index of every parameter."""
+        return sum(digit * stride for digit, stride in zip(digits, self._strides))
+
+    def values(self, index):
+        return tuple(p[d] for p, d in zip(self._parameters, self.digits(index)))
+
+    def __getitem__(self, index):
+        return [(p.name, p[d]) for p, d in zip(self._parameters, self.digits(index))]
+
+
+class Sampler(object):
+    """Search strategy choosing which combinations of a parameter space to compute.
+
+    A sampler proposes combination indices by next() until the budget is spent and
+    gets the metrics of each finished run by update(). Metrics are read from the
+    results file of the run, if results_filename is set.
+    """
+    def __init__(self, budget, seed=None):
+        self.budget = budget
+        self.results_filename = None
+        self._random = random.Random(seed)
+
+    def init(self, space, evaluated):
+        self._space = space
+        self._evaluated = set(evaluated)
+        self._proposed = set(evaluated)
+        self._remaining = min(self.budget, len(space)) - len(self._proposed)
+
+    def next(self):
+        if self._remaining <= 0 or len(self._proposed) >= len(self._space):
+            return None
+        index = self._propose()
+        self._proposed.add(index)
+        self._remaining -= 1
+        return index
+
+    def update(self, index, metrics):
+        self._evaluated.add(index)
+
+    def _propose(self):
+        return self._randomIndex()
+
+    def _randomIndex(self):
+        # rejection sampling is fast as long as the budget is small compared to the space
+        if len(self._proposed) < len(self._space) / 2:
+            while True:
+                index = self._random.randrange(len(self._space))
+                if index not in self._proposed:
+                    return index
+        return self._random.choice([i for i in xrange(len(self._space)) if i not in self._proposed])
+
+
+class RandomSampler(Sampler):
+    pass
+
+
+class LatinHypercubeSampler(Sampler):
+    """Stratify each parameter into budget intervals, every interval is sampled once."""
+    def init(self, space, evaluated):
+        super(LatinHypercubeSampler, self).init(space, evaluated)
+        count = max(self._remaining, 1)
+        strata = []
+        for radix in space.shape:
+            permutation = range(count)
+            self._random.shuffle(permutation)
+            strata.append(permutation)
+        self._design = []
+        for j in range(count):
+            digits = [int((s[j] + self._random.random()) * radix / count)
+                      for s, radix in zip(strata, space.shape)]
+            self._design.append(space.compose(digits))
+
+    def _propose(self):
+        while self._design:
+            index = self._design.pop()
+            if index not in self._proposed:
+                return index
+        return self._randomIndex()
+
+
+class ModelBasedSampler(Sampler):
+    """Sequential model-based optimization of a metric from the results files of runs.
+
+    After initial random runs, a tree-structured Parzen estimator models the parameter
+    values of the best gamma fraction of runs and of the rest. The candidate with the
+    highest ratio of both densities is computed next.
+    """
+    def __init__(self, metric, budget, results_filename='results.txt', minimize=True,
+                 initial=None, gamma=0.25, candidates=24, seed=None):
+        super(ModelBasedSampler, self).__init__(budget, seed)
+        self.results_filename = results_filename
+        self._metric = metric
+        self._minimize = minimize
+        self._initial = initial
+        self._gamma = gamma
+        self._candidates = candidates
+        self._observations = []
+
+    def init(self, space, evaluated):
+        super(ModelBasedSampler, self).init(space, evaluated)
+        if self._initial is None:
+            self._initial = max(10, 2 * len(space.shape))
+
+    def update(self, index, metrics):
+        super(ModelBasedSampler, self).update(index, metrics)
+        if metrics is None or self._metric not in metrics:
+            value = float('inf')
+        else:
+            value = metrics[self._metric] if self._minimize else -metrics[self._metric]
+        self._observations.append((value, self._space.digits(index)))
+
+    def _density(self, observations, radix):
+        # triangular kernel over neighbouring values plus a uniform prior
+        weights = [1.0 / radix] * radix
+        for _, digits in observations:
+            for offset, weight in ((-1, 0.5), (0, 1.0), (1, 0.5)):
+                if 0 <= digits + offset < radix:
+                    weights[digits + offset] += weight
+        total = sum(weights)
+        return [w / total for w in weights]
+
+    def _propose(self):
+        if len(self._observations) < self._initial:
+            return self._randomIndex()
+        observations = sorted(self._observations, key=lambda o: o[0])
+        n_good = max(1, int(math.ceil(self._gamma * len(observations))))
+        good, bad = observations[:n_good], observations[n_good:]
+        densities = [(self._density([(v, o[d]) for v, o in good], radix),
+                      self._density([(v, o[d]) for v, o in bad], radix))
+                     for d, radix in enumerate(self._space.shape)]
+        best_score, best_index = None, None
+        for _ in range(self._candidates):
+            score = 0.0
+            digits = []
+            for l, g in densities:
+                digit = self._weightedChoice(l)
+                digits.append(digit)
+                score += math.log(l[digit] / g[digit])
+            index = self._space.compose(digits)
+            if index not in self._proposed and (best_score is None or score > best_score):
+                best_score, best_index = score, index
+        if best_index is None:
+            return self._randomIndex()
+        return best_index
+
+    def _weightedChoice(self, weights):
+        r = self._random.random()
+        for i, w in enumerate(weights):
+            r -= w
+            if r <= 0:
+                return i
+        return len(weights) - 1
+
+
+class PythonTarget(object):
+    def __init__(self, function, initializer=None, results_filename='results.txt'):
+        """Setup a Python function as the application.
+
+    The function is called in a pool of processes with the dictionary of parameter values
+    and runs in the run folder as the current directory. Its printed output is saved like
+    the output of an application. A returned dictionary of metrics is saved into the
+    results file in the format read by XAnalyzer. Timeouts, pruning and warm workers
+    do not apply to it.
+
+    Args:
+        function: Function or its importable name 'module:function'. A function object has
+                  to be importable by worker processes as well
+        initializer: Function or its importable name called once by every worker process
+        results_filename: Name of the results file
+    """
+        self.function = function
+        self.initializer = initializer
+        self.results_filename = results_filename
+
+    @staticmethod
+    def resolve(function):
+        if callable(function):
+            return function
+        module_name, _, name = function.partition(':')
+        target = importlib.import_module(module_name)
+        for attribute in name.split('.'):
+            target = getattr(target, attribute)
+        return target
+
+    def sourcePath(self):
+        return inspect.getsourcefile(PythonTarget.resolve(self.function))
+
+
+_python_function = None
+
+
+def _initPythonTarget(function, initializer):
+    global _python_function
+    _python_function = PythonTarget.resolve(function)
+    if initializer is not None:
+        PythonTarget.resolve(initializer)()
+
+
+def _runPythonTarget(temp_dir, parameters, results_filename, stdout_filename):
+    start, times = time.time(), os.times()
+    status, reason, metrics = 'OK', None, None
+    stdout, cwd = sys.stdout, os.getcwd()
+    with open(os.path.join(temp_dir, stdout_filename), 'w') as output_file:
+        sys.stdout = output_file
+        os.chdir(temp_dir)
+        try:
+            metrics = _python_function(dict(parameters))
+        except Exception as e:
+            traceback.print_exc(file=output_file)
+            status, reason = 'FAIL', 'exception ' + type(e).__name__ + ': ' + str(e)
+        finally:
+            sys.stdout = stdout
+            os.chdir(cwd)
+    if metrics:
+        items = metrics.items() if isinstance(metrics, OrderedDict) else sorted(metrics.items())
+        with open(os.path.join(temp_dir, results_filename), 'w') as results_file:
+            for name, value in items:
+                results_file.write('%s %s\n' % (name, value))
+    end_times = os.times()
+    return status, reason, {'wall_time': round(time.time() - start, 3),
+                            'user_time': round(end_times[0] - times[0], 3),
+                            'system_time': round(end_times[1] - times[1], 3)}
+
+
+class WarmWorkers(object):
+    def __init__(self, args=(), mode='settings', max_jobs=None):
+        """Setup persistent instances of the application, each computing many runs.
+
+    An instance is started as the application with args and reads jobs from its stdin.
+    In the 'settings' mode a job is the line:
+        RUN<TAB>run folder<TAB>arguments
+    with the arguments of a single run of the application separated by tabs, i.e. the path of
+    the settings file or the arguments of the command.
+    In the 'parameters' mode it is the line RUN<TAB>run folder, followed by name=value
+    lines of all parameters and the line END. The application saves results into the run
+    folder and reports the end of the job by the line:
+        DONE<TAB>exit code[<TAB>output folder]
+    Other lines are the output of the job. Files of a different output folder are moved
+    into the run folder. An instance has to exit when its stdin is closed.
+
+    Args:
+        args: Command line arguments switching the application into this mode
+        mode: 'settings' or 'parameters'
+        max_jobs: Number of jobs after which an instance is restarted. None: no limit
+    """
+        if mode not in ('settings', 'parameters'):
+            sys.exit('Terminated. Unknown mode \'' + str(mode) + '\' of warm workers.')
+        self._args = list(args)
+        self._mode = mode
+        self._max_jobs = max_jobs
+        self._idle = Queue.Queue()
+
+    def job(self, temp_dir, arguments, parameters):
+        if self._mode == 'settings':
+            return 'RUN\t%s\t%s\n' % (temp_dir, '\t'.join(arguments))
+        return 'RUN\t%s\n' % temp_dir + ''.join('%s=%s\n' % pair for pair in parameters) + 'END\n'
+
+    def acquire(self, application_path):
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            return _WarmInstance(application_path, self._args)
+
+    def release(self, instance, restart=False):
+        instance.jobs += 1
+        if restart or (self._max_jobs is not None and instance.jobs >= self._max_jobs):
+            instance.stop(kill=restart)
+        else:
+            self._idle.put(instance)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except Queue.Empty:
+                break
+
+
+class _WarmInstance(object):
+    def __init__(self, application_path, args):
+        self.jobs = 0
+        self.process = subprocess.Popen([application_path] + args,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        preexec_fn=os.setsid)
+
+    def send(self, job):
+        self.process.stdin.write(job)
+        self.process.stdin.flush()
+
+    def stop(self, kill=False):
+        if kill:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class Transfer(object):
+    def __init__(self, scratch_path=None, threads=4, max_pending=None, batch_size=16):
+        """Setup computation in a local scratch folder and background transfer of the results.
+
+    Runs are computed in temporary folders on the scratch path, e.g. a tmpfs or a local disk,
+    so their files are written without round trips to a network output path. Computed runs
+    are moved to their destinations by a number of transfer threads, each taking batches of
+    runs. A new run waits while max_pending runs are computed or not moved yet.
+
+    Args:
+        scratch_path: Local folder for temporary folders of runs. None: the system temporary folder
+        threads: Number of threads moving the files
+        max_pending: Maximal number of runs being computed or waiting for the transfer.
+                     None: 4 times the number of processes
+        batch_size: Maximal number of runs moved by a thread at once
+    """
+        self.scratch_path = scratch_path or tempfile.gettempdir()
+        self._threads = threads
+        self._max_pending = max_pending
+        self._batch_size = batch_size
+        if not os.path.isdir(self.scratch_path):
+            sys.exit('Terminated. Scratch folder \'' + self.scratch_path + '\' is not found.')
+
+    def init(self, processes):
+        self._slots = threading.BoundedSemaphore(self._max_pending or 4 * processes)
+
+    def acquire(self):
+        self._slots.acquire()
+
+    def release(self):
+        self._slots.release()
+
+    def land(self, results, place):
+        """Move the computed results by place in the background and yield them when moved."""
+        staged = Queue.Queue()
+        landed = Queue.Queue()
+        feeder = threading.Thread(target=self._feed, args=(results, staged, landed))
+        feeder.daemon = True
+        feeder.start()
+        movers = [threading.Thread(target=self._move, args=(staged, landed, place))
+                  for _ in range(self._threads)]
+        for mover in movers:
+            mover.daemon = True
+            mover.start()
+        running = len(movers)
+        while running > 0:
+            result = landed.get()
+            if result is None:
+                running -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+        for mover in movers:
+            mover.join()
+
+    def _feed(self, results, staged, landed):
+        try:
+            for result in results:
+                staged.put(result)
+        except Exception as e:
+            landed.put(e)
+        for _ in range(self._threads):
+            staged.put(None)
+
+    def _move(self, staged, landed, place):
+        finished = False
+        while not finished:
+            batch = [staged.get()]
+            while batch[-1] is not None and len(batch) < self._batch_size:
+                try:
+                    batch.append(staged.get_nowait())
+                except Queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                finished = True
+            for result in batch:
+                try:
+                    landed.put(place(result))
+                except Exception as e:
+                    landed.put(e)
+                finally:
+                    self.release()
+        landed.put(None)
+
+
+class CostModel(object):
+    def __init__(self, cost=None, history=None):
+        """Setup estimation of run times of combinations to compute the longest runs first.
+
+    Without a cost function, the run time of a combination recorded in the history is used.
+    Run times of other combinations are estimated by a model, in which every parameter value
+    multiplies the run time by a factor learned from the recorded runs.
+
+    Args:
+        cost: Function of the dictionary of parameter values returning the expected run time.
+              None: run times are estimated from the history
+        history: List of 'stats.txt' files of previous executions with recorded run times.
+                 None: the stats file of the execution, if it exists
+    """
+        self._cost = cost
+        self.history = history
+        self._times = {}
+        self._observations = []
+
+    def learn(self, names, records):
+        for record in records:
+            info = record[4] if len(record) > 4 else {}
+            if record[1] != 'OK' or info.get('wall_time') is None or info.get('attempts') == 0:
+                continue
+            values = dict(zip(names, record[3]))
+            self._times[tuple(sorted(values.items()))] = info['wall_time']
+            self._observations.append((values, math.log(info['wall_time'] + 1e-3)))
+
+    def _fit(self):
+        self._mean = sum(y for _, y in self._observations) / max(len(self._observations), 1)
+        sums = {}
+        for values, y in self._observations:
+            for pair in values.items():
+                total, count = sums.get(pair, (0.0, 0))
+                sums[pair] = (total + y - self._mean, count + 1)
+        self._effects = dict((pair, total / count) for pair, (total, count) in sums.items())
+
+    def estimate(self, values):
+        """Returns the run time of parameter values estimated from the history."""
+        key = tuple(sorted(values.items()))
+        if key in self._times:
+            return self._times[key]
+        return math.exp(self._mean + sum(self._effects.get(pair, 0.0) for pair in values.items()))
+
+    def schedule(self, combinations, fixed_parameters, processes):
+        """Order combinations by decreasing expected run time.
+
+    Returns the ordered combinations and the makespan predicted for the number of processes.
+    """
+        if self._cost is None:
+            if len(self._observations) == 0:
+                print 'WARNING: There are no recorded run times to estimate costs of combinations.'
+            self._fit()
+        costs = {}
+        for iteration, parameters in combinations:
+            if self._cost is not None:
+                costs[iteration] = float(self._cost(dict(parameters + fixed_parameters.items())))
+            else:
+                costs[iteration] = self.estimate(dict(parameters))
+        combinations = sorted(combinations, key=lambda combination: -costs[combination[0]])
+        finish_times = [0.0] * max(processes, 1)
+        for iteration, _ in combinations:
+            heapq.heapreplace(finish_times, finish_times[0] + costs[iteration])
+        return combinations, max(finish_times)
+
+
+class Resources(object):
+    VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+    _libc = None
+
+    def __init__(self, threads=1, memory=0, cpus=None, total_memory=None, numa=True):
+        """Setup allocation of CPUs and memory to runs.
+
+    A run starts when its threads and memory fit into the free CPUs and memory. It is pinned
+    to a disjoint set of CPUs, taken from one NUMA node if possible, and the thread count
+    variables (OMP_NUM_THREADS etc.) are set to its number of CPUs. A run may overtake a
+    longer waiting run only if it leaves enough free resources for it.
+
+    Args:
+        threads: Number of threads of a run, or a function of the dictionary of parameter
+                 values returning it
+        memory: Memory of a run in bytes, or a function of the dictionary of parameter values
+                returning it
+        cpus: List of CPUs to use. None: all CPUs the process may run on
+        total_memory: Memory for runs in bytes. None: the total memory of the host
+        numa: Place a run on CPUs of one NUMA node if possible
+    """
+        self._threads = threads
+        self._memory = memory
+        self.cpus = list(cpus) if cpus is not None else Resources._allowedCPUs()
+        self._total_memory = total_memory if total_memory is not None else Resources._hostMemory()
+        nodes = Resources._numaNodes() if numa else []
+        # every CPU belongs to exactly one node
+        self._nodes = [[cpu for cpu in node if cpu in self.cpus] for node in nodes]
+        self._nodes = [node for node in self._nodes if node]
+        other = set(self.cpus) - set(cpu for node in self._nodes for cpu in node)
+        if other:
+            self._nodes.append(sorted(other))
+        self._free = [list(node) for node in self._nodes]
+        self._free_memory = self._total_memory
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        if Resources._libc is None:
+            # loaded here, runs are pinned in forked processes before they start the application
+            Resources._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+    @staticmethod
+    def _parseList(text):
+        cpus = []
+        for part in text.strip().split(','):
+            if '-' in part:
+                first, last = part.split('-')
+                cpus.extend(range(int(first), int(last) + 1))
+            elif part:
+                cpus.append(int(part))
+        return cpus
+
+    @staticmethod
+    def _allowedCPUs():
+        try:
+            with open('/proc/self/status', 'r') as status:
+                for line in status:
+                    if line.startswith('Cpus_allowed_list:'):
+                        return Resources._parseList(line.split(':', 1)[1])
+        except IOError:
+            pass
+        return range(multiprocessing.cpu_count())
+
+    @staticmethod
+    def _hostMemory():
+        try:
+            return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (ValueError, OSError):
+            return float('inf')
+
+    @staticmethod
+    def _numaNodes():
+        nodes = []
+        root = '/sys/devices/system/node'
+        if os.path.isdir(root):
+            for name in sorted(os.listdir(root)):
+                if re.match(r'node\d+$', name):
+                    with open(os.path.join(root, name, 'cpulist'), 'r') as cpulist:
+                        nodes.append(Resources._parseList(cpulist.read()))
+        return nodes
+
+    def _request(self, values):
+        threads = self._threads(values) if callable(self._threads) else self._threads
+        memory = self._memory(values) if callable(self._memory) else self._memory
+        # a run larger than everything would wait forever
+        return max(1, min(int(threads), len(self.cpus))), min(memory, self._total_memory)
+
+    def _fits(self, threads, memory, reserved=(0, 0)):
+        return sum(len(node) for node in self._free) - reserved[0] >= threads and \
+            self._free_memory - reserved[1] >= memory
+
+    def acquire(self, values):
+        """Wait until the run with the parameter values fits and returns its (cpus, memory)."""
+        request = self._request(values)
+        ticket = object()
+        with self._condition:
+            self._waiting.append((ticket, request))
+            while True:
+                head_ticket, head = self._waiting[0]
+                if head_ticket is ticket and self._fits(*request):
+                    break
+                if head_ticket is not ticket and self._fits(request[0], request[1], head):
+                    break
+                self._condition.wait()
+            self._waiting.remove((ticket, request))
+            threads, memory = request
+            cpus = []
+            # the best fitting node, otherwise CPUs of the nodes with the most free CPUs
+            fitting = [node for node in self._free if len(node) >= threads]
+            if fitting:
+                node = min(fitting, key=len)
+                cpus, node[:] = node[:threads], node[threads:]
+            else:
+                for node in sorted(self._free, key=len, reverse=True):
+                    taken = node[:threads - len(cpus)]
+                    cpus.extend(taken)
+                    node[:] = node[len(taken):]
+            self._free_memory -= memory
+            # other waiting runs may fit now
+            self._condition.notify_all()
+            return cpus, memory
+
+    def release(self, allocation):
+        cpus, memory = allocation
+        with self._condition:
+            for node, free in zip(self._nodes, self._free):
+                free.extend(cpu for cpu in cpus if cpu in node)
+                free.sort()
+            self._free_memory += memory
+            self._condition.notify_all()
+
+    def environment(self, allocation):
+        environment = dict(os.environ)
+        for variable in Resources.VARIABLES:
+            environment[variable] = str(len(allocation[0]))
+        return environment
+
+    @staticmethod
+    def pin(cpus):
+        """Pin the calling process to the CPUs, ignored where it is not supported."""
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+            return
+        # the mask covers the highest CPU, the kernel takes missing words as zero
+        bits = ctypes.sizeof(ctypes.c_ulong) * 8
+        mask = (ctypes.c_ulong * (max(cpus) // bits + 1))()
+        for cpu in cpus:
+            mask[cpu // bits] |= 1 << (cpu % bits)
+        Resources._libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask))
+
+
+class OutputLog(object):
+    CHUNK_SIZE = 65536
+
+    def __init__(self, max_size=None, head=None, compress=False, tail_size=65536):
+        """Setup saving of the output of the application.
+
+    The output is streamed to the file in chunks, so memory use does not depend on its size.
+
+    Args:
+        max_size: Maximal size of the saved output in bytes. Only the beginning and the end of
+                  a longer output are saved. None: no limit
+        head: Size of the beginning of a longer output in bytes. Default: half of max_size
+        compress: Save the output compressed with gzip
+        tail_size: Size of the end of the output kept in memory for diagnostics of failures.
+                   The end of a longer output saved in the file is kept on disk
+    """
+        self.max_size = max_size
+        self.head = head if head is not None or max_size is None else max_size // 2
+        self.compress = compress
+        self.tail_size = tail_size
+
+    def open(self, path):
+        return _OutputFile(self, path)
+
+
+class _OutputFile(object):
+    def __init__(self, log, path):
+        self._log = log
+        self._path = path
+        if log.compress:
+            self._file = gzip.open(path + '.gz', 'wb')
+        else:
+            self._file = open(path, 'wb')
+        self._written = 0
+        self._total = 0
+        self._tail = deque()
+        self._tail_length = 0
+        # the end of a longer output is kept in a ring file of max_size - head bytes
+        self._ring = None
+        self._ring_length = 0
+        self._ring_position = 0
+
+    def write(self, data):
+        self._total += len(data)
+        self._remember(data)
+        if self._log.max_size is None:
+            self._file.write(data)
+            self._written += len(data)
+            return
+        if self._written < self._log.head:
+            head = data[:self._log.head - self._written]
+            self._file.write(head)
+            self._written += len(head)
+            data = data[len(head):]
+        if data:
+            self._spill(data)
+
+    def _remember(self, data):
+        self._tail.append(data)
+        self._tail_length += len(data)
+        while self._tail_length - len(self._tail[0]) >= self._log.tail_size:
+            self._tail_length -= len(self._tail.popleft())
+
+    def _spill(self, data):
+        capacity = self._log.max_size - self._log.head
+        if capacity <= 0:
+            return
+        if self._ring is None:
+            self._ring = tempfile.TemporaryFile(dir=os.path.dirname(self._path) or None)
+        data = data[-capacity:]
+        self._ring_length += len(data)
+        while data:
+            part = data[:capacity - self._ring_position]
+            self._ring.seek(self._ring_position)
+            self._ring.write(part)
+            self._ring_position = (self._ring_position + len(part)) % capacity
+            data = data[len(part):]
+
+    def tail(self, size=None):
+        tail = ''.join(self._tail)
+        return tail[-(size or self._log.tail_size):]
+
+    def close(self):
+        if self._ring is not None:
+            capacity = self._log.max_size - self._log.head
+            kept = min(self._ring_length, capacity)
+            skipped = self._total - self._written - kept
+            if skipped > 0:
+                self._file.write('\n... %i bytes of the output are skipped ...\n' % skipped)
+            # the oldest kept byte follows the last written one once the ring is full
+            parts = [(0, kept)]
+            if self._ring_length > capacity:
+                parts = [(self._ring_position, capacity), (0, self._ring_position)]
+            for start, end in parts:
+                self._ring.seek(start)
+                while start < end:
+                    chunk = self._ring.read(min(OutputLog.CHUNK_SIZE, end - start))
+                    self._file.write(chunk)
+                    start += len(chunk)
+            self._ring.close()
+        elif self._log.max_size is not None and self._total > self._written:
+            self._file.write('\n... %i bytes of the output are skipped ...\n' %
+                             (self._total - self._written))
+        self._file.close()
+
+
+class RetryPolicy(object):
+    def __init__(self, attempts=3, backoff=1.0, multiplier=2.0, max_backoff=60.0,
+                 exit_codes=None, patterns=None, timeouts=True):
+        """Setup repetition of runs failed for transient reasons.
+
+    Args:
+        attempts: Maximal number of attempts of a run
+        backoff: Delay before the second attempt in seconds
+        multiplier: Growth of the delay with every next attempt
+        max_backoff: Maximal delay in seconds
+        exit_codes: Exit codes of transient failures. None: any exit code
+        patterns: Regular expressions searched in the end of the output of the application,
+                  which mark transient failures. None: output is not checked
+        timeouts: Whether runs exceeding the time limit are repeated
+    """
+        self.attempts = attempts
+        self._backoff, self._multiplier, self._max_backoff = backoff, multiplier, max_backoff
+        self._exit_codes = set(exit_codes) if exit_codes is not None else None
+        self._patterns = [re.compile(p) for p in patterns] if patterns is not None else None
+        self._timeouts = timeouts
+
+    def isTransient(self, reason, returncode, output):
+        if reason.startswith('timeout'):
+            return self._timeouts
+        if self._exit_codes is not None and returncode not in self._exit_codes:
+            return False
+        if self._patterns is not None:
+            return any(p.search(output) for p in self._patterns)
+        return True
+
+    def delay(self, attempt):
+        delay = min(self._backoff * self._multiplier ** (attempt - 1), self._max_backoff)
+        # jitter spreads repetitions of runs failed at the same time
+        return delay * random.uniform(0.5, 1.0)
+
+
+class Pruner(object):
+    """Stop runs early, whose progress is worse than progress of other runs.
+
+    Progress lines in the output of the application are recognized by a regular
+    expression with the groups (step, value) or only (value), in which case the step
+    is the number of the progress line. Alternatively, parser is a function of a line
+    returning (step, value) or None.
+    """
+    def __init__(self, pattern=None, parser=None, minimize=True, min_runs=5, warmup=0):
+        if (pattern is None) == (parser is None):
+            sys.exit('Terminated. Either pattern or parser of progress lines has to be specified.')
+        self._pattern = re.compile(pattern) if pattern is not None else None
+        self._parser = parser
+        self._minimize = minimize
+        self._min_runs = min_runs
+        self._warmup = warmup
+        self._lock = threading.Lock()
+        self._lines = {}
+        self._history = {}
+
+    def parse(self, line):
+        if self._parser is not None:
+            return self._parser(line)
+        match = self._pattern.search(line)
+        if match is None:
+            return None
+        groups = match.groups()
+        if len(groups) == 1:
+            return None, float(groups[0])
+        return float(groups[0]), float(groups[1])
+
+    def report(self, iteration, step, value):
+        """Record progress of the run. Returns True if the run has to be stopped."""
+        with self._lock:
+            if step is None:
+                step = self._lines.get(iteration, 0)
+                self._lines[iteration] = step + 1
+            value = value if self._minimize else -value
+            values = self._history.setdefault(step, {})
+            values[iteration] = value
+            if step < self._warmup or len(values) < self._min_runs:
+                return False
+            return self._prune(step, value, [v for i, v in values.items() if i != iteration])
+
+    def finish(self, iteration):
+        with self._lock:
+            self._lines.pop(iteration, None)
+
+    def _prune(self, step, value, others):
+        return False
+
+
+class MedianPruner(Pruner):
+    """Stop a run if its value is worse than the median of other runs at the same step."""
+    def _prune(self, step, value, others):
+        if len(others) == 0:
+            return False
+        others = sorted(others)
+        middle = len(others) // 2
+        median = others[middle] if len(others) % 2 else (others[middle - 1] + others[middle]) / 2.0
+        return value > median
+
+
+class SuccessiveHalvingPruner(Pruner):
+    """Stop a run at the rung steps min_step * eta^k, unless it is among the best 1/eta of runs at the rung."""
+    def __init__(self, pattern=None, parser=None, minimize=True, min_runs=5, min_step=1, eta=3):
+        super(SuccessiveHalvingPruner, self).__init__(pattern, parser, minimize, min_runs)
+        if min_step <= 0 or eta <= 1:
+            sys.exit('Terminated. Minimal step has to be positive and eta larger than 1.')
+        self._min_step = min_step
+        self._eta = eta
+
+    def _prune(self, step, value, others):
+        if step < self._min_step:
+            return False
+        rung = math.log(float(step) / self._min_step, self._eta)
+        if abs(rung - round(rung)) > 1e-9:
+            return False
+        survivors = max(1, (len(others) + 1) // self._eta)
+        return sum(1 for v in others if v < value) >= survivors
 
 
 class Parameter(object):
@@ -223,6 +2234,25 @@ class Parameter(object):
     def next(self):
         raise StopIteration
 
+    def values(self):
+        if getattr(self, '_cached_values', None) is None:
+            self._cached_values = tuple(value for value in self)
+        return self._cached_values
+
+    def __len__(self):
+        return len(self.values())
+
+    def __getitem__(self, index):
+        return self.values()[index]
+
+    @staticmethod
+    def _format(value):
+        """Decimal value as a string without trailing zeros of the fraction, e.g. '1.5' for 1.50."""
+        text = str(value)
+        if '.' in text and 'E' not in text:
+            text = text.rstrip('0').rstrip('.')
+        return text
+
 
 class LinearParameter(Parameter):
     def __init__(self, name, start, stop, step):
@@ -237,6 +2267,20 @@ class LinearParameter(Parameter):
                 (value <= self._start and value >= self._stop):
             yield str(value)
             value += self._step
+
+    def step(self):
+        return abs(self._step)
+
+    def finerStep(self, step, factor):
+        return step / factor
+
+    def around(self, value, step, factor):
+        """Values with the step around the value, which stay within the range of the parameter."""
+        low, high = min(self._start, self._stop), max(self._start, self._stop)
+        center = Decimal(value)
+        values = [self._format(center + j * step) if j != 0 else value
+                  for j in range(-factor, factor + 1)]
+        return [v for v in values if low <= Decimal(v) <= high]
               
 
 class ProgressionParameter(Parameter):
@@ -250,6 +2294,28 @@ class ProgressionParameter(Parameter):
         for i in self._u_range:
             yield str(self._base * (self._ratio ** i))
 
+    def step(self):
+        exponents = list(self._u_range)
+        step = self._ratio ** (exponents[1] - exponents[0] if len(exponents) > 1 else 1)
+        return step if step >= 1 else 1 / step
+
+    def finerStep(self, step, factor):
+        return step ** (Decimal(1) / factor)
+
+    def around(self, value, step, factor):
+        """Values with the ratio step around the value, which stay within the range of the parameter."""
+        bounds = [Decimal(v) for v in self.values()]
+        low, high = min(bounds), max(bounds)
+        if step == 1:
+            return [value]
+        # values are powers of the step from the lowest value and are rounded, so a value
+        # reached from different centers in different rounds has the same digits
+        position = int(round((Decimal(value) / low).ln() / step.ln()))
+        context = Context(prec=12)
+        values = [self._format(context.plus(low * step ** (position + j))) if j != 0 else value
+                  for j in range(-factor, factor + 1)]
+        return [v for v in values if low <= Decimal(v) <= high]
+
 
 class ExponentialParameter(Parameter):
     def __init__(self, name, base, u_range):
@@ -271,6 +2337,12 @@ class ListParameter(Parameter):
     def __iter__(self):
         return self._values.__iter__()
 
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
 
 class StringNumberParameter(Parameter):
     def __init__(self, name, length, u_range):
@@ -283,12 +2355,12 @@ class StringNumberParameter(Parameter):
 
 
 class Orderer(object):
-    def init(self, settings_path, output_path, count):
+    def init(self, settings_path, output_path, count, temp_path=None):
         self._len = len(str(count))
         self._output_path = output_path
-        self._settings_ext = os.path.splitext(settings_path)[1]
+        self._settings_ext = os.path.splitext(settings_path or '')[1]
         try:
-            self._root_temp = tempfile.mkdtemp(dir=self._output_path)
+            self._root_temp = tempfile.mkdtemp(dir=temp_path or self._output_path)
         except Exception as e:
             raise e
 
@@ -310,6 +2382,12 @@ class Orderer(object):
         except Exception as e:
             raise e          
 
+    def getRunFolder(self, iteration, parameters):
+        return self.getLocalTempFolder()
+
+    def checkParameters(self, parameters):
+        pass
+
     def clean(self):
         try:
             os.rmdir(self._root_temp)
@@ -325,32 +2403,204 @@ class Orderer(object):
 
 
 class TreeOrderer(Orderer):
-    def __init__(self, depth=0):
+    def __init__(self, depth=0, direct=False):
+        """Setup ordering of files of runs into folders named after the parameters.
+
+    Args:
+        depth: Number of folder levels, one per parameter. 0: all parameters; None: the output path
+        direct: Compute every run directly in its folder instead of a temporary folder. Every
+                combination needs its own folder, so depth has to cover all parameters. Files
+                of a previous run of the same combination are replaced
+    """
         self._depth = depth
-        self._lock = threading.Lock()
+        self._direct = direct
+        self._folders = set()
 
-    def orderFiles(self, iteration, parameters, path):
+    def init(self, settings_path, output_path, count, temp_path=None):
+        if self._direct and temp_path is not None:
+            sys.exit('Terminated. Runs cannot be computed directly in their folders with a transfer.')
+        super(TreeOrderer, self).init(settings_path, output_path, count, temp_path)
+
+    def _parametricPath(self, parameters):
         parametric_path = [param + '-' + str(value) for param, value in parameters]
         if self._depth == None:
-            destination = self._output_path
-        else:
-            if self._depth <= 0:
-                self._depth = len(parametric_path)
-            destination = os.path.join(self._output_path, *map(self._validateFilename, 
-                                                           parametric_path[:self._depth]))
-        with self._lock:
-            if not os.path.exists(destination):
-                try:
-                    os.makedirs(destination)
-                except OSError as e:
+            return []
+        if self._depth <= 0:
+            self._depth = len(parametric_path)
+        return map(self._validateFilename, parametric_path[:self._depth])
+
+    def _destination(self, parameters):
+        destination = os.path.join(self._output_path, *self._parametricPath(parameters))
+        if destination not in self._folders:
+            try:
+                os.makedirs(destination)
+            except OSError as e:
+                # created by another thread or process sharing the output path
+                if e.errno != errno.EEXIST:
                     raise e
-        for filename in os.listdir(path):
+            self._folders.add(destination)
+        return destination
+
+    def checkParameters(self, parameters):
+        if self._direct and (self._depth is None or 0 < self._depth < len(parameters)):
+            sys.exit('Terminated. Runs can be computed directly in their folders only if every ' + \
+                'parameter has a folder level.')
+
+    def getRunFolder(self, iteration, parameters):
+        if not self._direct:
+            return self.getLocalTempFolder()
+        folder = self._destination(parameters)
+        for filename in os.listdir(folder):
+            file_path = os.path.join(folder, filename)
+            if os.path.isdir(file_path) and not os.path.islink(file_path):
+                shutil.rmtree(file_path)
+            else:
+                os.remove(file_path)
+        return folder
+
+    def orderFiles(self, iteration, parameters, path):
+        destination = self._destination(parameters)
+        filenames = os.listdir(path)
+        for filename in filenames:
             indexed_filename = '{{:0{:d}d}}_{{:s}}'.format(self._len).format(iteration, filename)
-            while True:
-                try:
-                    os.rename(os.path.join(path, filename), os.path.join(destination, indexed_filename))
-                    break
-                except Exception, e:
-                    if os.path.isfile(os.path.join(destination, indexed_filename)):
-                        raise e
-        return destination
\ No newline at end of file
+            source = os.path.join(path, filename)
+            target = os.path.join(destination, indexed_filename)
+            try:
+                os.rename(source, target)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise e
+                # the run folder is on another file system, e.g. a local scratch. The copy
+                # appears under its name only when it is complete
+                temp_target = os.path.join(destination, '.' + indexed_filename + '.part')
+                if os.path.isdir(source) and not os.path.islink(source):
+                    shutil.copytree(source, temp_target, symlinks=True)
+                else:
+                    shutil.copy2(source, temp_target)
+                os.rename(temp_target, target)
+            # rename keeps both names if they link the same file, e.g. a cached result
+            if os.path.isdir(source) and not os.path.islink(source):
+                shutil.rmtree(source)
+            elif os.path.lexists(source):
+                os.remove(source)
+        return destination
+
+
+class ArchiveOrderer(TreeOrderer):
+    def __init__(self, archives=4, depth=0):
+        """Setup packing of files of runs into a few tar archives in the output path.
+
+    Files of a run are appended to one of the archives under the names TreeOrderer(depth)
+    would give them. Every execution writes new archives 'archive-<host>-<pid>-<n>-<i>.tar',
+    where n counts the executions of the process. Every archive has a sidecar ArchiveIndex
+    '.tar.idx' locating the files of runs. Files in subfolders of a run are named by their
+    relative path. 'stats.txt' records the archive as the folder of a run, XAnalyzer reads
+    results through the index and extract() recreates the folders of TreeOrderer.
+
+    Args:
+        archives: Number of archives written at the same time
+        depth: Folder levels of names of files in the archives like in TreeOrderer
+    """
+        super(ArchiveOrderer, self).__init__(depth)
+        self._archives = archives
+
+    def init(self, settings_path, output_path, count, temp_path=None):
+        super(ArchiveOrderer, self).init(settings_path, output_path, count, temp_path)
+        # names are unique for every execution, so shards and resumed executions never share
+        # archives, also when they run in the same process
+        stem = 'archive-%s-%d' % (self._validateFilename(socket.gethostname()), os.getpid())
+        execution = 0
+        while os.path.exists(os.path.join(self._output_path, '%s-%d-0.tar' % (stem, execution))):
+            execution += 1
+        self._tars = []
+        self._files = {}
+        # indices of archives of previous executions
+        self._indices = {}
+        for i in range(self._archives):
+            path = os.path.join(self._output_path, '%s-%d-%d.tar' % (stem, execution, i))
+            try:
+                # an existing archive is never truncated
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            except OSError as e:
+                sys.exit('Terminated. Cannot create archive \'' + path + '\'.')
+            self._tars.append((tarfile.open(path, 'w', format=tarfile.GNU_FORMAT),
+                               open(path + ArchiveIndex.EXTENSION, 'w'), threading.Lock()))
+
+    def orderFiles(self, iteration, parameters, path):
+        tar, index, lock = self._tars[iteration % len(self._tars)]
+        prefix = self.getIterationPrefix(iteration)
+        folder = '/'.join(self._parametricPath(parameters))
+        with lock:
+            for root, folders, filenames in os.walk(path):
+                folders.sort()
+                for filename in sorted(filenames):
+                    file_path = os.path.join(root, filename)
+                    filename = os.path.relpath(file_path, path).replace(os.sep, '/')
+                    member = folder + '/' + prefix + '_' + filename if folder else prefix + '_' + filename
+                    tarinfo = tar.gettarinfo(file_path, member)
+                    with open(file_path, 'rb') as member_file:
+                        tar.addfile(tarinfo, member_file)
+                    # the data is followed by the padding to the block size
+                    offset = tar.offset - int(math.ceil(tarinfo.size / float(tarfile.BLOCKSIZE))) * \
+                        tarfile.BLOCKSIZE
+                    tar.fileobj.flush()
+                    index.write(ArchiveIndex.line(prefix, filename, member, offset, tarinfo.size))
+                    self._files[(prefix, filename)] = (tar.name, offset, tarinfo.size)
+                    os.remove(file_path)
+            index.flush()
+        for filename in os.listdir(path):
+            shutil.rmtree(os.path.join(path, filename))
+        return tar.name
+
+    def readFile(self, iteration, filename, archive_path=None):
+        """Returns the content of a file of a run or None.
+
+    Args:
+        iteration: Iteration of the run
+        filename: Name of the file without the prefix of the run
+        archive_path: Archive of a previous execution with the run. None: the run is packed
+                      in this execution
+    """
+        key = (self.getIterationPrefix(iteration), filename)
+        entry = self._files.get(key)
+        if entry is None and archive_path is not None and \
+                os.path.isfile(archive_path + ArchiveIndex.EXTENSION):
+            if archive_path not in self._indices:
+                self._indices[archive_path] = ArchiveIndex.read(archive_path)
+            if key in self._indices[archive_path]:
+                entry = (archive_path,) + self._indices[archive_path][key]
+        if entry is None:
+            return None
+        archive_path, offset, size = entry
+        with open(archive_path, 'rb') as archive:
+            archive.seek(offset)
+            return archive.read(size)
+
+    def clean(self):
+        for tar, index, _ in self._tars:
+            tar.close()
+            index.close()
+        super(ArchiveOrderer, self).clean()
+
+    @staticmethod
+    def extract(output_path, destination=None):
+        """Recreate the folders of TreeOrderer from the archives in output_path.
+
+    Args:
+        output_path: Output path of the execution with the archives
+        destination: Folder to extract to. None: output_path
+    """
+        destination = destination or output_path
+        for filename in sorted(os.listdir(output_path)):
+            if not filename.startswith('archive-') or not filename.endswith('.tar'):
+                continue
+            archive_path = os.path.join(output_path, filename)
+            with open(archive_path, 'rb') as archive:
+                # only indexed members, the end of an interrupted archive may be incomplete
+                for _, _, member, offset, size in ArchiveIndex.entries(archive_path):
+                    member_path = os.path.join(destination, *member.split('/'))
+                    if not os.path.isdir(os.path.dirname(member_path)):
+                        os.makedirs(os.path.dirname(member_path))
+                    archive.seek(offset)
+                    with open(member_path, 'wb') as member_file:
+                        member_file.write(archive.read(size))
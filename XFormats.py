@@ -0,0 +1,125 @@
+
+"""
+Formats of files written by XAutomate and read by XAnalyzer
+
+Both modules import them from here, so XAnalyzer does not depend on the orchestrator.
+"""
+
+import ast
+import json
+import os
+from collections import OrderedDict
+
+
+class ArchiveIndex(object):
+    """Sidecar index '<archive>.idx' of a tar archive written by ArchiveOrderer.
+
+    Every line repr((prefix, filename, member, offset, size)) locates the data of the file
+    of a run in the archive.
+    """
+    EXTENSION = '.idx'
+
+    @staticmethod
+    def line(prefix, filename, member, offset, size):
+        return repr((prefix, filename, member, offset, size)) + '\n'
+
+    @staticmethod
+    def entries(archive_path):
+        """Yields (prefix, filename, member, offset, size) of the indexed files of the archive."""
+        with open(archive_path + ArchiveIndex.EXTENSION, 'r') as index:
+            for line in index:
+                # a trailing line cut off by a crash is not part of the index
+                if not line.endswith('\n'):
+                    break
+                yield ast.literal_eval(line)
+
+    @staticmethod
+    def read(archive_path):
+        """Returns the dictionary of (offset, size) of files of runs by (prefix, filename)."""
+        return dict(((prefix, filename), (offset, size))
+                    for prefix, filename, _, offset, size in ArchiveIndex.entries(archive_path))
+
+
+class StatsJournal(object):
+    """Format of the stats journal 'stats.txt' and of the quarantine file.
+
+    The first line is the header
+        {"format": "xautomate-stats", "version": 2, "parameters": [parameter names]}
+    and every next line is the record of a run
+        {"run": prefix, "status": status, "path": folder, "values": [parameter values], "info": {...}}
+    with typed JSON values. Records are read as tuples (prefix, status, path, values, info).
+    Journals of the version 1 with repr() lines are read safely and converted by convert().
+    """
+    FORMAT = 'xautomate-stats'
+    VERSION = 2
+
+    @staticmethod
+    def header(names):
+        return json.dumps(OrderedDict([('format', StatsJournal.FORMAT), ('version', StatsJournal.VERSION),
+                                       ('parameters', list(names))])) + '\n'
+
+    @staticmethod
+    def record(prefix, status, path, values, info):
+        # values of other types, e.g. Decimal, are saved as strings
+        return json.dumps(OrderedDict([('run', prefix), ('status', status), ('path', path),
+                                       ('values', list(values)), ('info', info)]), default=str) + '\n'
+
+    @staticmethod
+    def parseHeader(line):
+        """Returns the version and the parameter names of the header line."""
+        if not line.lstrip().startswith('{'):
+            return 1, tuple(ast.literal_eval(line))
+        header = json.loads(line)
+        if header.get('format') != StatsJournal.FORMAT or header.get('version') > StatsJournal.VERSION:
+            raise ValueError('Unknown format of the stats journal: ' + line.strip())
+        return header['version'], tuple(header['parameters'])
+
+    @staticmethod
+    def parseRecord(line, version):
+        if version == 1:
+            record = ast.literal_eval(line)
+            return tuple(record[:4]) + (record[4] if len(record) > 4 else {},)
+        record = json.loads(line)
+        return record['run'], record['status'], record['path'], tuple(record['values']), \
+            record.get('info', {})
+
+    @staticmethod
+    def parseRecords(lines, version, status=None):
+        """Returns the records of the lines, only the records with the status if it is given.
+
+    A record with the status contains it as a JSON string, so other lines are not decoded.
+    """
+        if status is not None and version > 1:
+            quoted = json.dumps(status)
+            lines = [line for line in lines if quoted in line]
+        records = [StatsJournal.parseRecord(line, version) for line in lines]
+        if status is None:
+            return records
+        return [record for record in records if record[1] == status]
+
+    @staticmethod
+    def version(stats_path):
+        with open(stats_path, 'r') as stats_file:
+            return StatsJournal.parseHeader(stats_file.readline())[0]
+
+    @staticmethod
+    def convert(stats_path, destination=None):
+        """Convert a journal to the current version.
+
+    Args:
+        stats_path: Path of the journal
+        destination: Path of the converted journal. None: the journal is replaced
+    """
+        destination = destination or stats_path
+        temp_path = destination + '.part'
+        with open(stats_path, 'r') as stats_file, open(temp_path, 'w') as converted:
+            version, names = StatsJournal.parseHeader(stats_file.readline())
+            converted.write(StatsJournal.header(names))
+            for line in stats_file:
+                # a trailing line cut off by a crash is dropped
+                if not line.endswith('\n'):
+                    break
+                converted.write(StatsJournal.record(*StatsJournal.parseRecord(line, version)))
+            converted.flush()
+            os.fsync(converted.fileno())
+        os.rename(temp_path, destination)
@@ -0,0 +1,53 @@
+"""
+Shared setup of the tests: a shell application reading its settings file and writing a metric
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from XAutomate import XAutomate, TreeOrderer
+
+APPLICATION = '''#!/bin/sh
+. "$1"
+echo "alpha=$alpha sigma=$sigma"
+echo "error $((alpha * 10 + sigma))" > results.txt
+'''
+
+SETTINGS = 'alpha=${alpha}\nsigma=${sigma}\n'
+
+
+class ExecutionTestCase(unittest.TestCase):
+    """Executions of the application in a temporary folder, removed after every test."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.application_path = self.write('application.sh', APPLICATION)
+        os.chmod(self.application_path, 0755)
+        self.settings_path = self.write('settings.sh', SETTINGS)
+        self.output_path = os.path.join(self.folder, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, filename, content):
+        path = os.path.join(self.folder, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def automate(self, alphas=('1', '2', '3', '4'), sigmas=('1', '2'), orderer=None):
+        automate = XAutomate(self.application_path, self.settings_path, self.output_path,
+                             orderer or TreeOrderer(depth=None))
+        automate.addListParameter('alpha', list(alphas))
+        automate.addListParameter('sigma', list(sigmas))
+        return automate
+
+    def readStats(self, automate, filename='stats.txt'):
+        """Returns the parameter names and the records of a journal in the output path."""
+        names, records, _ = automate._readStats(os.path.join(self.output_path, filename))
+        return names, records
+
+    def error(self, values):
+        return int(values[0]) * 10 + int(values[1])
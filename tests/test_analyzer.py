@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from XAnalyzer import XAnalyzer
+from XFormats import StatsJournal
+
+
+class AnalyzerTest(unittest.TestCase):
+    """Analysis of a journal written like by XAutomate with TreeOrderer(depth=0)."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.stats_path = os.path.join(self.folder, 'stats.txt')
+        with open(self.stats_path, 'w') as stats:
+            stats.write(StatsJournal.header(['alpha', 'sigma']))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def record(self, iteration, alpha, sigma, status='OK', error=None):
+        """Append the record of a run and write its results file, unless error is False."""
+        prefix = '%02d' % iteration
+        with open(self.stats_path, 'a') as stats:
+            stats.write(StatsJournal.record(prefix, status, '.', [alpha, sigma], {'wall_time': 0.5}))
+        if error is not False:
+            self.results(iteration, alpha, sigma, error)
+
+    def results(self, iteration, alpha, sigma, error=None):
+        if error is None:
+            error = int(alpha) * 10 + int(sigma)
+        with open(os.path.join(self.folder, '%02d_results.txt' % iteration), 'w') as results:
+            results.write('error %s\n' % error)
+
+    def grid(self, alphas=('1', '2'), sigmas=('1', '2')):
+        for alpha in alphas:
+            for sigma in sigmas:
+                self.record(len(self.recorded()), alpha, sigma)
+
+    def recorded(self):
+        with open(self.stats_path, 'r') as stats:
+            return stats.readlines()[1:]
+
+    def value(self, analyzer, alpha, sigma, metric='error'):
+        index = (analyzer._param_values[0].index(alpha), analyzer._param_values[1].index(sigma),
+                 analyzer._metric_names.index(metric))
+        return analyzer._np_array[index]
+
+    def testResults(self):
+        self.grid()
+        self.record(4, '3', '1', status='FAIL')
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(analyzer._run_prefixes, ['00', '01', '02', '03'])
+        self.assertEqual(analyzer._param_values, [['1', '2'], ['1', '2']])
+        self.assertEqual(analyzer._metric_names, ['error', 'wall_time'])
+        self.assertEqual(self.value(analyzer, '2', '1'), 21)
+        self.assertEqual(self.value(analyzer, '1', '2', 'wall_time'), 0.5)
+
+    def testCacheIsUsed(self):
+        self.grid()
+        XAnalyzer(self.stats_path, 'results.txt')
+        self.assertTrue(os.path.isfile(self.stats_path + '.results.txt.npz'))
+        self.results(0, '1', '1', error=100)
+        self.assertEqual(self.value(XAnalyzer(self.stats_path, 'results.txt'), '1', '1'), 11)
+        self.assertEqual(self.value(XAnalyzer(self.stats_path, 'results.txt', rebuild=True), '1', '1'), 100)
+        self.assertEqual(self.value(XAnalyzer(self.stats_path, 'results.txt', cache=False), '1', '1'), 100)
+
+    def testAppendedRunsAreAddedToCache(self):
+        self.grid()
+        XAnalyzer(self.stats_path, 'results.txt')
+        self.results(0, '1', '1', error=100)
+        self.grid(alphas=('3',))
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(analyzer._run_prefixes, ['00', '01', '02', '03', '04', '05'])
+        self.assertEqual(self.value(analyzer, '1', '1'), 11)
+        self.assertEqual(self.value(analyzer, '3', '2'), 32)
+
+    def testChangedJournalInvalidatesCache(self):
+        self.grid()
+        XAnalyzer(self.stats_path, 'results.txt')
+        lines = self.recorded()
+        with open(self.stats_path, 'w') as stats:
+            stats.write(StatsJournal.header(['alpha', 'sigma']))
+            stats.writelines(lines[:-1])
+            stats.write(lines[-1].replace('"OK"', '"FAIL"'))
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(analyzer._run_prefixes, ['00', '01', '02'])
+        self.assertTrue(np.isnan(self.value(analyzer, '2', '2')))
+
+    def testRefresh(self):
+        self.grid()
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(analyzer.refresh(), 0)
+        self.grid(alphas=('3',), sigmas=('1', '2', '3'))
+        self.assertEqual(analyzer.refresh(), 3)
+        self.assertEqual(analyzer._param_values, [['1', '2', '3'], ['1', '2', '3']])
+        self.assertEqual(self.value(analyzer, '3', '3'), 33)
+        self.assertEqual(self.value(analyzer, '2', '1'), 21)
+        self.assertTrue(np.isnan(self.value(analyzer, '1', '3')))
+        # the refreshed results are cached
+        self.assertEqual(XAnalyzer(self.stats_path, 'results.txt')._run_prefixes,
+                         ['00', '01', '02', '03', '04', '05', '06'])
+
+    def testPartialLineIsReadByRefresh(self):
+        self.grid()
+        self.record(4, '3', '1')
+        line = self.recorded()[-1]
+        with open(self.stats_path, 'r+') as stats:
+            stats.truncate(os.path.getsize(self.stats_path) - len(line) // 2)
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(len(analyzer._run_prefixes), 4)
+        with open(self.stats_path, 'r+') as stats:
+            stats.truncate(os.path.getsize(self.stats_path) - len(line) + len(line) // 2)
+            stats.seek(0, os.SEEK_END)
+            stats.write(line)
+        self.assertEqual(analyzer.refresh(), 1)
+        self.assertEqual(self.value(analyzer, '3', '1'), 31)
+
+    def testPartialLineIsReadOnNextLoad(self):
+        self.grid()
+        self.record(4, '3', '1')
+        line = self.recorded()[-1]
+        with open(self.stats_path, 'r+') as stats:
+            stats.truncate(os.path.getsize(self.stats_path) - len(line) // 2)
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(len(analyzer._run_prefixes), 4)
+        with open(self.stats_path, 'r+') as stats:
+            stats.truncate(os.path.getsize(self.stats_path) - len(line) + len(line) // 2)
+            stats.seek(0, os.SEEK_END)
+            stats.write(line)
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(len(analyzer._run_prefixes), 5)
+        self.assertEqual(self.value(analyzer, '3', '1'), 31)
+
+    def testMissingResultsAreReadAgain(self):
+        self.grid()
+        self.record(4, '3', '1', error=False)
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(len(analyzer._run_prefixes), 4)
+        self.assertEqual(analyzer.refresh(), 0)
+        self.results(4, '3', '1')
+        self.assertEqual(analyzer.refresh(), 1)
+        self.assertEqual(self.value(analyzer, '3', '1'), 31)
+
+    def testMissingResultsAreReadAgainFromCache(self):
+        self.grid()
+        self.record(4, '3', '1', error=False)
+        XAnalyzer(self.stats_path, 'results.txt')
+        self.results(4, '3', '1')
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.assertEqual(self.value(analyzer, '3', '1'), 31)
+        self.assertEqual(len(XAnalyzer(self.stats_path, 'results.txt')._run_prefixes), 5)
+
+    def testMemoryMappedArray(self):
+        self.grid(alphas=('1', '2', '3'))
+        array_path = os.path.join(self.folder, 'array.npy')
+        analyzer = XAnalyzer(self.stats_path, 'results.txt', array_path=array_path)
+        self.assertIsInstance(analyzer._np_array.base, np.memmap)
+        self.assertEqual(self.value(analyzer, '3', '2'), 32)
+        self.assertEqual(analyzer.reduce('error'), 11)
+        self.assertEqual(analyzer.reduce('error', 'argmax'), ('3', '2'))
+        self.assertEqual(list(analyzer.reduce('error', 'mean', 'sigma')), [11.5, 21.5, 31.5])
+        loaded = XAnalyzer.load(array_path)
+        self.assertEqual(loaded._param_values, analyzer._param_values)
+        self.assertEqual(loaded.reduce('error', 'max'), 32)
+        self.assertEqual(list(loaded.reduce('error', 'argmin', 'alpha')), [0, 0])
+
+    def testSavedArray(self):
+        self.grid()
+        self.record(4, '3', '1')
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        array_path = os.path.join(self.folder, 'saved.npy')
+        analyzer.saveNPArray(array_path)
+        loaded = XAnalyzer.load(array_path)
+        self.assertEqual(loaded.reduce('error', 'argmax'), ('3', '1'))
+        self.assertTrue(np.isnan(self.value(loaded, '3', '2')))
+
+    def testGrownArrayIsSavedInPlace(self):
+        self.grid()
+        array_path = os.path.join(self.folder, 'array.npy')
+        analyzer = XAnalyzer(self.stats_path, 'results.txt', array_path=array_path)
+        self.grid(alphas=('3',), sigmas=('1', '2', '3'))
+        self.assertEqual(analyzer.refresh(), 3)
+        self.assertEqual(os.path.realpath(analyzer._np_array.base.filename), os.path.realpath(array_path))
+        analyzer.saveNPArray(array_path)
+        loaded = XAnalyzer.load(array_path)
+        self.assertEqual(loaded._param_values, [['1', '2', '3'], ['1', '2', '3']])
+        self.assertEqual(self.value(loaded, '3', '3'), 33)
+        self.assertEqual(self.value(loaded, '1', '2'), 12)
+        self.assertTrue(np.isnan(self.value(loaded, '1', '3')))
+
+    def testCallbacks(self):
+        self.grid()
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        counts = []
+        analyzer.addCallback(lambda analyzer, count: counts.append((count, len(analyzer._run_prefixes))))
+        analyzer.refresh()
+        self.grid(alphas=('3',))
+        analyzer.refresh()
+        self.assertEqual(counts, [(2, 6)])
+
+    def testFollowStopsWhenIdle(self):
+        self.grid()
+        analyzer = XAnalyzer(self.stats_path, 'results.txt')
+        self.grid(alphas=('3',))
+        analyzer.follow(interval=0.01, metric_name='error', idle=0.05)
+        self.assertEqual(len(analyzer._run_prefixes), 6)
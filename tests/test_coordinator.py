@@ -0,0 +1,122 @@
+import json
+import os
+import socket
+import threading
+import time
+
+from XAutomate import Coordinator
+from tests.helpers import ExecutionTestCase
+
+
+class Worker(object):
+    """Client talking the protocol of the coordinator."""
+
+    def __init__(self, address):
+        self.connection = socket.create_connection(address)
+        self.stream = self.connection.makefile('rw')
+
+    def request(self, message):
+        self.stream.write(json.dumps(message) + '\n')
+        self.stream.flush()
+        return json.loads(self.stream.readline())
+
+    def get(self):
+        reply = self.request({'type': 'get'})
+        return reply['iteration'] if reply['type'] == 'job' else reply['type']
+
+    def report(self, iteration):
+        return self.request({'type': 'result', 'iteration': iteration, 'destination': '.',
+                             'status': 'OK', 'cached': False, 'info': {}})
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+class CoordinatorTest(ExecutionTestCase):
+    def coordinator(self, count, lease_timeout=None):
+        combinations = ((i, [('alpha', str(i))]) for i in range(count))
+        coordinator = Coordinator(('127.0.0.1', 0), self.output_path, combinations, ('alpha',),
+                                  count, lease_timeout)
+        self.addCleanup(coordinator.close)
+        return coordinator
+
+    def worker(self, coordinator):
+        worker = Worker(coordinator.localAddress())
+        self.addCleanup(worker.close)
+        return worker
+
+    def testHello(self):
+        worker = self.worker(self.coordinator(3))
+        self.assertEqual(worker.request({'type': 'hello'}), {'type': 'hello', 'names': ['alpha'], 'count': 3})
+
+    def testServesEveryCombinationOnce(self):
+        coordinator = self.coordinator(3)
+        first, second = self.worker(coordinator), self.worker(coordinator)
+        self.assertEqual([first.get(), second.get(), first.get()], [0, 1, 2])
+        for iteration in range(3):
+            self.assertEqual(first.report(iteration), {'type': 'ok'})
+        results = list(coordinator.results(3))
+        self.assertEqual([result[0] for result in results], [0, 1, 2])
+        self.assertEqual(results[1][1], [('alpha', '1')])
+        self.assertEqual(results[1][2], os.path.join(self.output_path, '.'))
+        self.assertEqual(first.get(), 'stop')
+
+    def testWaitForAssignedCombinations(self):
+        coordinator = self.coordinator(1)
+        first, second = self.worker(coordinator), self.worker(coordinator)
+        self.assertEqual(first.get(), 0)
+        self.assertEqual(second.get(), 'wait')
+        first.report(0)
+        self.assertEqual(second.get(), 'stop')
+
+    def testRequeueOnDisconnect(self):
+        coordinator = self.coordinator(1)
+        first, second = self.worker(coordinator), self.worker(coordinator)
+        self.assertEqual(first.get(), 0)
+        first.close()
+        # the combination is served again when the coordinator reads the end of the connection
+        deadline = time.time() + 5
+        iteration = second.get()
+        while iteration == 'wait' and time.time() < deadline:
+            time.sleep(0.05)
+            iteration = second.get()
+        self.assertEqual(iteration, 0)
+
+    def testRequeueAfterLeaseTimeout(self):
+        coordinator = self.coordinator(1, lease_timeout=0.2)
+        first, second = self.worker(coordinator), self.worker(coordinator)
+        self.assertEqual(first.get(), 0)
+        self.assertEqual(second.get(), 'wait')
+        time.sleep(0.3)
+        self.assertEqual(second.get(), 0)
+        # the late result of the first worker is taken, the result of the second one is ignored
+        first.report(0)
+        second.report(0)
+        self.assertEqual(len(list(coordinator.results(1))), 1)
+        self.assertEqual(first.get(), 'stop')
+        self.assertTrue(coordinator._results.empty())
+
+
+class CoordinatedExecutionTest(ExecutionTestCase):
+    def testLocalWorkers(self):
+        self.automate().execute(processes=2, coordinator=('127.0.0.1', 0))
+        names, records = self.readStats(self.automate())
+        self.assertEqual(sorted(int(record[0]) for record in records), range(8))
+        self.assertTrue(all(record[1] == 'OK' for record in records))
+
+    def testRemoteWorker(self):
+        address = os.path.join(self.folder, 'coordinator.sock')
+        execution = threading.Thread(target=self.automate().execute,
+                                     kwargs={'processes': None, 'coordinator': address})
+        execution.start()
+        deadline = time.time() + 10
+        while not os.path.exists(address) and time.time() < deadline:
+            time.sleep(0.05)
+        self.automate().work(address, processes=2)
+        execution.join()
+        _, records = self.readStats(self.automate())
+        self.assertEqual(sorted(int(record[0]) for record in records), range(8))
+        for record in records:
+            with open(os.path.join(self.output_path, record[2], record[0] + '_results.txt')) as f:
+                self.assertEqual(f.read(), 'error %d\n' % self.error(record[3]))
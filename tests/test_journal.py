@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from XFormats import StatsJournal
+
+
+class StatsJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def testHeader(self):
+        line = StatsJournal.header(['alpha', 'sigma'])
+        self.assertTrue(line.endswith('\n'))
+        self.assertEqual(json.loads(line), {'format': 'xautomate-stats', 'version': 2,
+                                            'parameters': ['alpha', 'sigma']})
+        self.assertEqual(StatsJournal.parseHeader(line), (2, ('alpha', 'sigma')))
+
+    def testUnknownHeader(self):
+        with self.assertRaises(ValueError):
+            StatsJournal.parseHeader('{"format": "other", "version": 2, "parameters": []}\n')
+        with self.assertRaises(ValueError):
+            StatsJournal.parseHeader(json.dumps({'format': 'xautomate-stats', 'version': 3,
+                                                 'parameters': []}) + '\n')
+
+    def testRecordRoundTrip(self):
+        values = ['a "quoted"\tvalue\n', u'ünïcode', '\\', 5, 0.1]
+        info = {'wall_time': 1.5, 'attempts': 2, 'reason': 'exit code 1: "OK"'}
+        line = StatsJournal.record('07', 'FAIL', 'alpha-1', values, info)
+        self.assertEqual(line.count('\n'), 1)
+        self.assertEqual(StatsJournal.parseRecord(line, 2),
+                         ('07', 'FAIL', 'alpha-1', tuple(values), info))
+
+    def testSpecialValues(self):
+        line = StatsJournal.record('1', 'OK', '.', [Decimal('0.10'), float('nan'), float('inf')], {})
+        _, _, _, values, _ = StatsJournal.parseRecord(line, 2)
+        self.assertEqual(values[0], '0.10')
+        self.assertTrue(math.isnan(values[1]))
+        self.assertEqual(values[2], float('inf'))
+
+    def testParseRecordsWithStatus(self):
+        lines = [StatsJournal.record('0', 'OK', '.', ['1'], {}),
+                 StatsJournal.record('1', 'FAIL', '.', ['OK'], {'reason': '"OK"'}),
+                 StatsJournal.record('2', 'PRUNED', '.', ['3'], {}),
+                 StatsJournal.record('3', 'OK', '.', ['4'], {'wall_time': 2.0})]
+        self.assertEqual([record[0] for record in StatsJournal.parseRecords(lines, 2)],
+                         ['0', '1', '2', '3'])
+        records = StatsJournal.parseRecords(lines, 2, 'OK')
+        self.assertEqual([record[0] for record in records], ['0', '3'])
+        self.assertEqual(records[1][4], {'wall_time': 2.0})
+
+    def testVersion1(self):
+        header = repr(('alpha', 'sigma')) + '\n'
+        self.assertEqual(StatsJournal.parseHeader(header), (1, ('alpha', 'sigma')))
+        # records of the first version may have no resources
+        self.assertEqual(StatsJournal.parseRecord(repr(('0', 'OK', '.', ('1', '2'))) + '\n', 1),
+                         ('0', 'OK', '.', ('1', '2'), {}))
+        self.assertEqual(StatsJournal.parseRecord(repr(('1', 'OK', '.', ('1', '3'), {'a': 1})), 1),
+                         ('1', 'OK', '.', ('1', '3'), {'a': 1}))
+        lines = [repr(('0', 'OK', '.', ('1', '2'))) + '\n', repr(('1', 'FAIL', '.', ('1', '3')))]
+        self.assertEqual([record[0] for record in StatsJournal.parseRecords(lines, 1, 'OK')], ['0'])
+
+    def testVersion1IsNotEvaluated(self):
+        with self.assertRaises(ValueError):
+            StatsJournal.parseRecord("__import__('os').remove('stats.txt')\n", 1)
+
+    def testConvert(self):
+        stats_path = os.path.join(self.folder, 'stats.txt')
+        with open(stats_path, 'w') as f:
+            f.write(repr(('alpha',)) + '\n')
+            f.write(repr(('0', 'OK', '.', ('1',), {'wall_time': 0.5})) + '\n')
+            f.write(repr(('1', 'FAIL', 'alpha-2', ('2',))) + '\n')
+            # cut off by a crash
+            f.write(repr(('2', 'OK', '.', ('3',)))[:10])
+        self.assertEqual(StatsJournal.version(stats_path), 1)
+        StatsJournal.convert(stats_path)
+        self.assertEqual(StatsJournal.version(stats_path), 2)
+        with open(stats_path, 'r') as f:
+            lines = f.readlines()
+        self.assertEqual(StatsJournal.parseHeader(lines[0]), (2, ('alpha',)))
+        self.assertEqual(StatsJournal.parseRecords(lines[1:], 2),
+                         [('0', 'OK', '.', ('1',), {'wall_time': 0.5}),
+                          ('1', 'FAIL', 'alpha-2', ('2',), {})])
+        self.assertFalse(os.path.exists(stats_path + '.part'))
+
@@ -0,0 +1,54 @@
+import os
+
+from tests.helpers import ExecutionTestCase
+
+
+class ResumeTest(ExecutionTestCase):
+    def runs(self):
+        _, records = self.readStats(self.automate())
+        return sorted((int(record[0]), record[1]) for record in records)
+
+    def testCompletedRunsAreSkipped(self):
+        self.automate().execute(processes=2)
+        with open(os.path.join(self.output_path, '0_results.txt'), 'w') as f:
+            f.write('error 100\n')
+        self.automate().execute(processes=2, resume=True)
+        self.assertEqual(self.runs(), [(i, 'OK') for i in range(8)])
+        with open(os.path.join(self.output_path, '0_results.txt')) as f:
+            self.assertEqual(f.read(), 'error 100\n')
+
+    def testInterruptedRecordIsComputedAgain(self):
+        self.automate().execute(processes=2)
+        stats_path = os.path.join(self.output_path, 'stats.txt')
+        with open(stats_path, 'r+') as stats:
+            lines = stats.readlines()
+            # the last record is cut off by a crash
+            stats.truncate(sum(len(line) for line in lines) - len(lines[-1]) // 2)
+        self.automate().execute(processes=2, resume=True)
+        self.assertEqual(self.runs(), [(i, 'OK') for i in range(8)])
+
+    def testRunsWithoutFilesAreComputedAgain(self):
+        self.automate().execute(processes=2)
+        for filename in os.listdir(self.output_path):
+            if filename.startswith('3_'):
+                os.remove(os.path.join(self.output_path, filename))
+        stats_path = os.path.join(self.output_path, 'stats.txt')
+        with open(stats_path, 'r') as stats:
+            lines = stats.readlines()
+        # a failed run recorded before its successful run of an earlier resume
+        with open(stats_path, 'w') as stats:
+            stats.writelines(lines[:1] + [lines[1].replace('OK', 'FAIL')] + lines[1:])
+        self.automate().execute(processes=2, resume=True)
+        self.assertEqual(self.runs(), [(i, 'OK') for i in range(8)])
+        with open(os.path.join(self.output_path, '3_results.txt')) as f:
+            self.assertEqual(f.read(), 'error 22\n')
+
+    def testDifferentParameters(self):
+        self.automate().execute(processes=2)
+        stats_path = os.path.join(self.output_path, 'stats.txt')
+        with open(stats_path, 'r') as stats:
+            lines = stats.readlines()
+        with open(stats_path, 'w') as stats:
+            stats.writelines([lines[0].replace('sigma', 'beta')] + lines[1:])
+        with self.assertRaises(SystemExit):
+            self.automate().execute(processes=2, resume=True)
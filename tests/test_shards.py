@@ -0,0 +1,70 @@
+import os
+
+from tests.helpers import ExecutionTestCase
+
+
+class ShardTest(ExecutionTestCase):
+    def testShardsComputeDisjointParts(self):
+        for shard in range(3):
+            self.automate().execute(processes=2, shard=shard, num_shards=3)
+        computed = []
+        for shard in range(3):
+            names, records = self.readStats(self.automate(), 'stats.shard-%d-of-3.txt' % shard)
+            self.assertEqual(names, ('alpha', 'sigma'))
+            iterations = [int(record[0]) for record in records]
+            self.assertTrue(all(iteration % 3 == shard for iteration in iterations))
+            computed.extend(iterations)
+        self.assertEqual(sorted(computed), range(8))
+
+    def testShardFromEnvironment(self):
+        os.environ['XAUTOMATE_SHARD'], os.environ['XAUTOMATE_NUM_SHARDS'] = '1', '2'
+        try:
+            self.automate().execute(processes=1)
+        finally:
+            del os.environ['XAUTOMATE_SHARD'], os.environ['XAUTOMATE_NUM_SHARDS']
+        _, records = self.readStats(self.automate(), 'stats.shard-1-of-2.txt')
+        self.assertEqual([int(record[0]) for record in records], [1, 3, 5, 7])
+
+    def testWrongShard(self):
+        with self.assertRaises(SystemExit):
+            self.automate().execute(shard=2, num_shards=2)
+        with self.assertRaises(SystemExit):
+            self.automate().execute(shard=0)
+
+    def testMergeShardStats(self):
+        for shard in range(2):
+            self.automate().execute(processes=2, shard=shard, num_shards=2)
+        automate = self.automate()
+        automate.mergeShardStats(2)
+        names, records = self.readStats(automate)
+        self.assertEqual(names, ('alpha', 'sigma'))
+        self.assertEqual([int(record[0]) for record in records], range(8))
+        self.assertTrue(all(record[1] == 'OK' for record in records))
+        for record in records:
+            with open(os.path.join(self.output_path, record[2], record[0] + '_results.txt')) as f:
+                self.assertEqual(f.read(), 'error %d\n' % self.error(record[3]))
+
+    def testMergeTakesLastRecord(self):
+        for shard in range(2):
+            self.automate().execute(processes=1, shard=shard, num_shards=2)
+        shard_path = os.path.join(self.output_path, 'stats.shard-0-of-2.txt')
+        _, shard_records = self.readStats(self.automate(), 'stats.shard-0-of-2.txt')
+        with open(shard_path, 'r') as f:
+            lines = f.readlines()
+        # the first run recorded again, e.g. by a resumed shard
+        with open(shard_path, 'a') as f:
+            f.write(lines[1].replace('OK', 'FAIL'))
+        automate = self.automate()
+        automate.mergeShardStats(2)
+        _, records = self.readStats(automate)
+        self.assertEqual([int(record[0]) for record in records], range(8))
+        statuses = dict((record[0], record[1]) for record in records)
+        self.assertEqual(statuses.pop(shard_records[0][0]), 'FAIL')
+        self.assertEqual(set(statuses.values()), set(['OK']))
+
+    def testMergeWithoutShardStats(self):
+        self.automate().execute(processes=1, shard=1, num_shards=2)
+        automate = self.automate()
+        automate.mergeShardStats(2)
+        _, records = self.readStats(automate)
+        self.assertEqual([int(record[0]) for record in records], [1, 3, 5, 7])